@@ -0,0 +1,68 @@
+"""Measure the per-message cost of the durable outbox.
+
+Simulates `concurrency` requests being accepted at the same time: each one
+awaits Outbox.add() (the commit the HTTP request waits for) and later marks the
+entry sent, like the send path of the API controller does.
+
+    python benchmarks/bench_outbox.py --messages 20000 --concurrency 1 10 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.outbox import Outbox
+
+
+async def run(path, messages, concurrency, batch_size):
+    outbox = Outbox(path, batch_size=batch_size)
+    outbox.open()
+    latencies = []
+    remaining = iter(range(messages))
+
+    async def request_loop():
+        for _ in remaining:
+            entry_id = uuid.uuid4().hex
+            started = time.perf_counter()
+            await outbox.add(entry_id, '+10000000000', '@destination', 'benchmark message ' * 4)
+            latencies.append(time.perf_counter() - started)
+            outbox.mark(entry_id, 'sent')
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    outbox.close()
+    return elapsed, latencies, outbox.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'msg/s':>9} {'us/msg':>8} {'p50 ms':>7} {'p99 ms':>7} {'commits':>8} {'writes/commit':>13}")
+    for concurrency in args.concurrency:
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed, latencies, stats = asyncio.run(
+                run(os.path.join(tmp, 'outbox.db'), args.messages, concurrency, args.batch_size)
+            )
+        latencies.sort()
+        writes = stats['added'] + stats['marked']
+        print(
+            f"{concurrency:>11} {args.messages / elapsed:>9.0f} {elapsed / args.messages * 1e6:>8.1f} "
+            f"{statistics.median(latencies) * 1000:>7.2f} {latencies[int(len(latencies) * 0.99)] * 1000:>7.2f} "
+            f"{stats['commits']:>8} {writes / max(1, stats['commits']):>13.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Load-test /send-message against fake accounts.
+
+Starts the API controller in-process with FakeTelegramClient accounts (see
+fake_client.py) and drives /send-message over HTTP with `concurrency`
+closed-loop clients for `duration` seconds per account count. Reports
+requests/sec, latency percentiles, status counts and resident memory of the
+process (server and load driver together).
+
+    python benchmarks/bench_send.py --accounts 1 10 100 --concurrency 200 --duration 10
+    python benchmarks/bench_send.py --server-mode asyncio --reply-delay 0.2 --flood-wait-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fake_client import fake_client_factory
+from src.controllers.api_controller import APIController
+from src.models.api_settings import APISettings
+
+
+class NullView:
+    """View that discards log output so logging does not dominate the measurement"""
+    def log_message(self, message, level='info'):
+        if level == 'error':
+            print(message, file=sys.stderr)
+
+    def update_api_status(self, status, color):
+        pass
+
+    def request_login_code(self, phone, api_id):
+        return None
+
+    def request_password(self, phone):
+        return None
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        # Peak instead of current where /proc is not available (kB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def wait_until_ready(session, url):
+    """Wait for the server thread to accept connections"""
+    for _ in range(100):
+        try:
+            async with session.get(f'{url}/stats') as response:
+                await response.read()
+            return
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.1)
+
+
+async def drive(url, phones, duration, concurrency, destinations):
+    """Closed-loop load: each client sends its next request as soon as the previous one returns"""
+    latencies = []
+    statuses = Counter()
+    sequence = iter(range(sys.maxsize))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await wait_until_ready(session, url)
+
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                index = next(sequence)
+                payload = {
+                    'phone': phones[index % len(phones)],
+                    'destination': f'@bench_user_{index % destinations}',
+                    'message': f'benchmark message {index}'
+                }
+                started = time.perf_counter()
+                try:
+                    async with session.post(f'{url}/send-message', json=payload) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, statuses
+
+
+def start_controller(tmp, phones, port, factory, settings=None, **overrides):
+    """Start the API for fake `phones` on 127.0.0.1:`port`, keeping its files in `tmp`"""
+    credentials_file = os.path.join(tmp, 'credentials.json')
+    with open(credentials_file, 'w') as f:
+        json.dump([{'phone': phone, 'api_id': '1', 'api_hash': 'fake'} for phone in phones], f)
+    values = settings.to_dict() if settings else {}
+    values.update(overrides)
+    values.update(
+        host='127.0.0.1',
+        port=port,
+        credentials_file=credentials_file,
+        entity_cache_file=os.path.join(tmp, 'entity_cache.json'),
+        media_cache_file=os.path.join(tmp, 'media_cache.json'),
+        outbox_file=os.path.join(tmp, 'outbox.db'),
+        capture_file=None
+    )
+    controller = APIController(NullView(), APISettings.from_dict(values), client_factory=factory)
+    controller.start_api()
+    return controller
+
+
+def run(accounts, port, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        phones = [f'+1555{index:07d}' for index in range(accounts)]
+        factory = fake_client_factory(
+            resolve_latency=args.resolve_latency,
+            send_latency=args.send_latency,
+            reply_delay=args.reply_delay if args.reply_delay >= 0 else None,
+            flood_wait_rate=args.flood_wait_rate,
+            flood_wait_seconds=args.flood_wait_seconds
+        )
+        rss_before = rss_mb()
+        controller = start_controller(
+            tmp, phones, port, factory,
+            server_mode=args.server_mode,
+            queue_depth=args.queue_depth,
+            reply_timeout=args.reply_timeout,
+            rate_limit_per_second=args.rate_limit,
+            rate_limit_per_destination_per_minute=0
+        )
+        try:
+            elapsed, latencies, statuses = asyncio.run(
+                drive(f'http://127.0.0.1:{port}', phones, args.duration, args.concurrency, args.destinations)
+            )
+            rss_after = rss_mb()
+            flood_waits = sum(client.calls['flood_wait'] for client in controller.clients.values())
+        finally:
+            controller.stop_api()
+    latencies.sort()
+    return {
+        'accounts': accounts,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'ok': statuses.get(200, 0),
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'statuses': dict(statuses),
+        'flood_waits': flood_waits,
+        'rss': rss_after,
+        'rss_delta': rss_after - rss_before
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load per account count')
+    parser.add_argument('--destinations', type=int, default=50, help='Distinct destinations used')
+    parser.add_argument('--server-mode', choices=('flask', 'asyncio'), default='flask')
+    parser.add_argument('--port', type=int, default=5600, help='First port; each run uses the next one')
+    parser.add_argument('--queue-depth', type=int, default=1000)
+    parser.add_argument('--reply-timeout', type=float, default=10)
+    parser.add_argument('--rate-limit', type=float, default=0, help='Sends per second per account (0 disables)')
+    parser.add_argument('--resolve-latency', type=float, default=0.005)
+    parser.add_argument('--send-latency', type=float, default=0.02)
+    parser.add_argument('--reply-delay', type=float, default=0.05, help='Seconds until the reply (-1 for none)')
+    parser.add_argument('--flood-wait-rate', type=float, default=0.0, help='Share of sends answered with FLOOD_WAIT')
+    parser.add_argument('--flood-wait-seconds', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per run instead of a table')
+    args = parser.parse_args()
+    # Per-request access log lines of the Flask server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    if not args.json:
+        print(f"{'accounts':>8} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'errors':>6} {'floods':>6} {'rss MB':>7} {'+MB':>6}")
+    for index, accounts in enumerate(args.accounts):
+        # The Flask server thread cannot be stopped, so every run gets its own port
+        result = run(accounts, args.port + index, args)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(
+            f"{result['accounts']:>8} {result['requests']:>8} {result['rps']:>8.1f} {result['p50']:>8.1f} "
+            f"{result['p95']:>8.1f} {result['p99']:>8.1f} {result['errors']:>6} {result['flood_waits']:>6} "
+            f"{result['rss']:>7.1f} {result['rss_delta']:>6.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
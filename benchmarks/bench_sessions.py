@@ -0,0 +1,152 @@
+"""Compare per-account .session files with the shared SQLite session store.
+
+Creates `sessions` sessions with `entities` known entities each, in both
+formats, then measures each backend in a fresh process: cold start (opening
+every session and resolving one username per account), open file
+descriptors, memory, a save round (new entities and update state for every
+account) and entity lookups.
+
+    python benchmarks/bench_sessions.py --sessions 100 --entities 1000
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from telethon.crypto import AuthKey
+from telethon.sessions import SQLiteSession
+from telethon.tl import types
+
+from bench_send import rss_mb
+from src.utils.session_store import SessionStore
+
+
+def open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def users(session_index, start, count):
+    return [
+        types.User(
+            id=session_index * 1_000_000 + i + 1, access_hash=random.getrandbits(63), username=f'user{session_index}_{i}',
+            phone=f'84{session_index:03d}{i:06d}', first_name=f'User {i}'
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def state():
+    return types.updates.State(random.randint(1, 10 ** 6), 0, datetime.datetime.now(tz=datetime.timezone.utc), 1, 0)
+
+
+def create(directory, sessions, entities):
+    """Write every session as a .session file, then import them all into sessions.db"""
+    names = [os.path.join(directory, f'telegram_session_+1555{index:07d}') for index in range(sessions)]
+    for index, name in enumerate(names):
+        session = SQLiteSession(name)
+        session.set_dc(2, '149.154.167.51', 443)
+        session.auth_key = AuthKey(os.urandom(256))
+        session.process_entities(users(index, 0, entities))
+        session.set_update_state(0, state())
+        session.save()
+        session.close()
+    store = SessionStore(os.path.join(directory, 'sessions.db'))
+    store.open()
+    for name in names:
+        store.session(name)
+    store.close()
+    return names
+
+
+def measure(backend, directory, sessions, entities, lookups):
+    """Run in a fresh process: cold start, save round and lookups of one backend"""
+    names = [os.path.join(directory, f'telegram_session_+1555{index:07d}') for index in range(sessions)]
+    fds_before, rss_before = open_fds(), rss_mb()
+
+    started = time.perf_counter()
+    store = None
+    if backend == 'files':
+        opened = [SQLiteSession(name) for name in names]
+    else:
+        store = SessionStore(os.path.join(directory, 'sessions.db'), flush_interval=3600)
+        store.open()
+        opened = [store.session(name) for name in names]
+    for index, session in enumerate(opened):
+        session.get_input_entity(f'user{index}_0')
+    cold_start = time.perf_counter() - started
+    fds, rss = open_fds(), rss_mb()
+
+    # Every account learns 10 entities and a new update state, then saves (one commit per file vs one in total)
+    started = time.perf_counter()
+    for index, session in enumerate(opened):
+        session.process_entities(users(index, 10 ** 5, 10))
+        session.set_update_state(0, state())
+        session.save()
+    if store:
+        store.flush()
+    save_round = time.perf_counter() - started
+
+    keys = []
+    for _ in range(lookups):
+        index = random.randrange(sessions)
+        keys.append((index, f'user{index}_{random.randrange(entities)}'))
+    started = time.perf_counter()
+    for index, username in keys:
+        opened[index].get_input_entity(username)
+    lookup = (time.perf_counter() - started) / len(keys)
+
+    for session in opened:
+        session.close()
+    if store:
+        store.close()
+    return {
+        'backend': backend,
+        'cold_start_ms': round(cold_start * 1000, 1),
+        'open_fds': fds - fds_before if fds is not None else None,
+        'rss_mb': round(rss - rss_before, 1),
+        'save_round_ms': round(save_round * 1000, 1),
+        'lookup_us': round(lookup * 1e6, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--entities', type=int, default=1000, help='Known entities per session')
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--measure', choices=('files', 'sqlite'), help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.dir, args.sessions, args.entities, args.lookups)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Creating {args.sessions} sessions with {args.entities} entities each...")
+        create(directory, args.sessions, args.entities)
+        print(f"{'backend':>8} {'cold start ms':>13} {'open fds':>8} {'+MB':>6} {'save round ms':>13} {'lookup us':>9}")
+        for backend in ('files', 'sqlite'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--measure', backend, '--dir', directory,
+                 '--sessions', str(args.sessions), '--entities', str(args.entities), '--lookups', str(args.lookups)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['backend']:>8} {result['cold_start_ms']:>13.1f} {str(result['open_fds']):>8} "
+                  f"{result['rss_mb']:>6.1f} {result['save_round_ms']:>13.1f} {result['lookup_us']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Check webhook delivery against a local receiver.
+
+Starts an aiohttp receiver on 127.0.0.1 that answers each POST with the next
+status of a script, then drives WebhookDispatcher against it: batching by
+size and by flush interval, retries on 5xx and 429, no retry on other 4xx, and
+the flush of queued events in close(). Exits with status 1 if a check fails.
+
+    python benchmarks/check_webhook.py --port 5690
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiohttp import web
+
+from src.utils.webhook import WebhookDispatcher
+
+
+class Receiver:
+    """Records the delivered batches, answering with scripted statuses (200 once the script is used up)"""
+    def __init__(self):
+        self.statuses = []
+        self.requests = []  # Event ids of every POST, including the ones answered with an error
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests.append([event['id'] for event in body['events']])
+        status = self.statuses.pop(0) if self.statuses else 200
+        return web.json_response({'status': status}, status=status)
+
+    def reset(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+
+
+async def dispatch(url, events, batch_size=5, flush_interval=0.2, max_retries=3, wait=0.5):
+    """Publish events, give the dispatcher `wait` seconds, then close it; returns its stats"""
+    dispatcher = WebhookDispatcher(
+        url, batch_size, flush_interval, max_retries, retry_backoff=0.01,
+        queue_size=1000, timeout=5, log=lambda message, level='info': None
+    )
+    await dispatcher.start()
+    for event_id in events:
+        dispatcher.publish({'id': event_id})
+    await asyncio.sleep(wait)
+    await dispatcher.close()
+    return dispatcher.stats()
+
+
+async def run_checks(port):
+    receiver = Receiver()
+    app = web.Application()
+    app.router.add_post('/hook', receiver.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    url = f'http://127.0.0.1:{port}/hook'
+    results = []
+
+    def check(name, passed, detail):
+        results.append(passed)
+        print(f"{'PASS' if passed else 'FAIL'} {name}: {detail}")
+
+    try:
+        receiver.reset()
+        stats = await dispatch(url, range(12))
+        sizes = [len(batch) for batch in receiver.requests]
+        check('batching', sizes == [5, 5, 2] and stats['delivered'] == 12,
+              f"batch sizes {sizes}, {stats['delivered']} delivered")
+
+        for status in (500, 503, 429):
+            receiver.reset([status, status])
+            stats = await dispatch(url, range(3))
+            check(f'retry on {status}', len(receiver.requests) == 3 and stats['delivered'] == 3,
+                  f"{len(receiver.requests)} attempts, {stats['delivered']} delivered")
+
+        receiver.reset([500] * 10)
+        stats = await dispatch(url, range(3), max_retries=2)
+        check('gives up after max_retries', len(receiver.requests) == 3 and stats['failed'] == 3,
+              f"{len(receiver.requests)} attempts, {stats['failed']} failed")
+
+        for status in (400, 404):
+            receiver.reset([status])
+            stats = await dispatch(url, range(3))
+            check(f'no retry on {status}', len(receiver.requests) == 1 and stats['failed'] == 3,
+                  f"{len(receiver.requests)} attempts, {stats['failed']} failed")
+
+        # Neither batch_size nor flush_interval is reached before close()
+        receiver.reset()
+        stats = await dispatch(url, range(7), batch_size=100, flush_interval=60, wait=0.1)
+        delivered = [event_id for batch in receiver.requests for event_id in batch]
+        check('flush on close', delivered == list(range(7)) and stats['delivered'] == 7,
+              f"{len(receiver.requests)} requests, events {delivered}")
+    finally:
+        await runner.cleanup()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5690)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_checks(args.port)) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""In-process stand-in for TelegramClient used by the benchmarks.
+
+Implements the calls the API controller makes (connect, get_input_entity,
+send_message, send_file, raw requests and NewMessage handlers) with
+configurable latencies, so the send path can be measured without real
+accounts or network. Pass `fake_client_factory(...)` as the controller's
+`client_factory`.
+"""
+import asyncio
+import random
+import zlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon import errors, utils
+from telethon.tl import types
+
+
+class FakeTelegramClient:
+    """Account whose Telegram calls only sleep.
+
+    Latencies are in seconds and vary by up to `jitter` (a fraction) either
+    way. Each send_message raises FLOOD_WAIT with probability
+    `flood_wait_rate`, and every delivered message is answered by the
+    destination after `reply_delay` seconds (never when it is None).
+    `reply_delay` may also be a function of the message text returning
+    the delay, as used by the traffic replay.
+    """
+    def __init__(self, session, api_id, api_hash, loop=None, resolve_latency=0.005, send_latency=0.02,
+                 reply_delay=0.05, flood_wait_rate=0.0, flood_wait_seconds=1, jitter=0.5, **kwargs):
+        self.session = session
+        self.resolve_latency = resolve_latency
+        self.send_latency = send_latency
+        self.reply_delay = reply_delay
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.jitter = jitter
+        self.random = random.Random(zlib.crc32(str(getattr(session, 'name', session)).encode()))
+        self.handlers = []
+        self.connected = False
+        self.next_message_id = 1
+        self.calls = {'resolve': 0, 'send': 0, 'flood_wait': 0, 'reply': 0}
+
+    async def _latency(self, seconds):
+        if seconds:
+            await asyncio.sleep(seconds * (1 + self.jitter * (2 * self.random.random() - 1)))
+
+    async def connect(self):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def is_user_authorized(self):
+        return True
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append(callback)
+
+    async def get_input_entity(self, destination):
+        self.calls['resolve'] += 1
+        await self._latency(self.resolve_latency)
+        if isinstance(destination, int):
+            user_id = destination
+        else:
+            # Stable id per username or phone number
+            user_id = zlib.crc32(str(destination).encode()) or 1
+        return types.InputPeerUser(user_id=user_id, access_hash=0)
+
+    async def get_peer_id(self, peer):
+        return utils.get_peer_id(peer)
+
+    async def get_entity(self, destination):
+        return await self.get_input_entity(destination)
+
+    def _message(self, peer, text, media=None):
+        message = SimpleNamespace(
+            id=self.next_message_id, date=datetime.now(timezone.utc), message=text, text=text,
+            media=media, peer_id=peer
+        )
+        self.next_message_id += 1
+        return message
+
+    async def send_message(self, entity, message, **kwargs):
+        self.calls['send'] += 1
+        await self._latency(self.send_latency)
+        if self.flood_wait_rate and self.random.random() < self.flood_wait_rate:
+            self.calls['flood_wait'] += 1
+            raise errors.FloodWaitError(request=None, capture=self.flood_wait_seconds)
+        chat_id = utils.get_peer_id(entity)
+        reply_delay = self.reply_delay(message) if callable(self.reply_delay) else self.reply_delay
+        if reply_delay is not None:
+            asyncio.get_event_loop().call_later(
+                max(0, reply_delay), lambda: asyncio.ensure_future(self._reply(chat_id, message))
+            )
+        return self._message(entity, message)
+
+    async def send_file(self, entity, file, caption=None, **kwargs):
+        sent = await self.send_message(entity, caption or '')
+        sent.media = None
+        return sent
+
+    async def __call__(self, request):
+        # Raw requests are only file part uploads
+        await self._latency(self.send_latency)
+        return True
+
+    async def _reply(self, chat_id, text):
+        self.calls['reply'] += 1
+        event = SimpleNamespace(
+            out=False, chat_id=chat_id, sender_id=chat_id, sender=None, is_private=True,
+            message=self._message(types.PeerUser(chat_id), f'Re: {text}')
+        )
+        for handler in list(self.handlers):
+            await handler(event)
+
+
+def fake_client_factory(**options):
+    """`client_factory` for APIController building FakeTelegramClients with `options`"""
+    def factory(session, api_id, api_hash, **kwargs):
+        return FakeTelegramClient(session, api_id, api_hash, **{**kwargs, **options})
+    return factory
@@ -0,0 +1,167 @@
+"""Replay captured /send-message traffic against fake accounts.
+
+Reads captures written with the `capture_file` setting (several files, such
+as the per-worker captures of `--workers`, are merged) and sends their
+requests to an in-process API backed by FakeTelegramClient accounts, keeping
+the recorded arrival times (compressed by `--speed`) so bursts are
+reproduced. Destinations reply after the delay recorded for each message.
+Reports the replayed latencies and statuses next to the recorded ones.
+
+    python benchmarks/replay_traffic.py config/capture.ndjson.gz --speed 1
+    python benchmarks/replay_traffic.py config/capture.ndjson.gz --speed 10 --settings config/api_settings.json
+    python benchmarks/replay_traffic.py config/capture.ndjson.gz --speed 0  # as fast as possible
+    python benchmarks/replay_traffic.py config/capture.shard-*.ndjson.gz
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_send import percentile, rss_mb, start_controller, wait_until_ready
+from fake_client import fake_client_factory
+from src.models.api_settings import APISettings
+from src.utils.traffic_capture import read_capture
+
+
+def recorded_reply_delays(entries, default):
+    """Reply delay function for the fake clients: recorded delays of each message text, in order"""
+    delays = defaultdict(deque)
+    for entry in entries:
+        if entry['s'] == 200 and not entry['a']:
+            delays[entry['m']].append(entry['r'])
+
+    def reply_delay(text):
+        recorded = delays.get(text)
+        return recorded.popleft() if recorded else default
+    return reply_delay
+
+
+async def replay(url, entries, speed, concurrency):
+    """Send every entry at its recorded offset divided by `speed` (all at once when speed is 0)"""
+    latencies = []
+    statuses = Counter()
+    lags = []
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await wait_until_ready(session, url)
+
+        async def send(entry, due):
+            async with semaphore:
+                lags.append(max(0.0, time.perf_counter() - due))
+                payload = {key: entry[short] for key, short in (('phone', 'p'), ('destination', 'd'), ('message', 'm'))}
+                started = time.perf_counter()
+                try:
+                    async with session.post(
+                        f"{url}/send-message{'?async=1' if entry['a'] else ''}", json=payload
+                    ) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        first = entries[0]['time']
+        tasks = []
+        started = time.perf_counter()
+        for entry in entries:
+            due = started + ((entry['time'] - first) / speed if speed else 0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(send(entry, due)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, statuses, lags
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return {name: round(percentile(latencies, fraction) * 1000, 1)
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('captures', nargs='+', help='Capture files written with the capture_file setting')
+    parser.add_argument('--speed', type=float, default=1, help='Replay speed factor; 0 sends everything at once')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    parser.add_argument('--concurrency', type=int, default=1000, help='Max requests in flight')
+    parser.add_argument('--settings', help='API settings file to replay against (defaults otherwise)')
+    parser.add_argument('--server-mode', choices=('flask', 'asyncio'), help='Overrides the settings')
+    parser.add_argument('--port', type=int, default=5650)
+    parser.add_argument('--resolve-latency', type=float, default=0.005)
+    parser.add_argument('--send-latency', type=float, default=0.02)
+    parser.add_argument('--reply-delay', type=float, default=0.05, help='Used for messages without a recorded reply delay')
+    parser.add_argument('--flood-wait-rate', type=float, default=0.0)
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    # Written in completion order, replayed in arrival order
+    entries = sorted(
+        (entry for capture in args.captures for entry in read_capture(capture)), key=lambda entry: entry['time']
+    )[:args.limit]
+    if not entries:
+        parser.error(f"{', '.join(args.captures)} contains no requests")
+    phones = sorted({entry['p'] for entry in entries if entry['p']}) or ['+15550000000']
+
+    settings = APISettings.load(args.settings) if args.settings else APISettings()
+    overrides = {}
+    if args.server_mode:
+        overrides['server_mode'] = args.server_mode
+    if any(not entry['p'] for entry in entries):
+        # Requests without a phone were routed by the balancer
+        overrides['balancing_enabled'] = True
+    factory = fake_client_factory(
+        resolve_latency=args.resolve_latency,
+        send_latency=args.send_latency,
+        reply_delay=recorded_reply_delays(entries, args.reply_delay),
+        flood_wait_rate=args.flood_wait_rate
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        controller = start_controller(tmp, phones, args.port, factory, settings, **overrides)
+        try:
+            elapsed, latencies, statuses, lags = asyncio.run(
+                replay(f'http://127.0.0.1:{args.port}', entries, args.speed, args.concurrency)
+            )
+        finally:
+            controller.stop_api()
+
+    result = {
+        'requests': len(entries),
+        'accounts': len(phones),
+        'speed': args.speed,
+        'recorded_seconds': round(entries[-1]['time'] - entries[0]['time'], 3),
+        'replay_seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'recorded': {**summary([entry['l'] for entry in entries]), 'statuses': dict(Counter(entry['s'] for entry in entries))},
+        'replayed': {**summary(latencies), 'statuses': dict(statuses)},
+        'max_schedule_lag_ms': round(max(lags, default=0) * 1000, 1),
+        'rss_mb': round(rss_mb(), 1)
+    }
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"{result['requests']} requests on {result['accounts']} accounts, recorded over {result['recorded_seconds']}s, "
+          f"replayed at {f'{args.speed}x' if args.speed else 'max'} speed in {result['replay_seconds']}s ({result['rps']} req/s)")
+    print(f"{'':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for name in ('recorded', 'replayed'):
+        row = result[name]
+        print(f"{name:>9} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f}  {row['statuses']}")
+    print(f"max schedule lag {result['max_schedule_lag_ms']} ms, rss {result['rss_mb']} MB")
+
+
+if __name__ == '__main__':
+    main()
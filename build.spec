@@ -14,6 +14,7 @@ a = Analysis(
     hiddenimports=[
         'telethon',
         'flask',
+        'aiohttp',
         'python-dotenv',
         'queue',
         'threading',
@@ -1,100 +1,222 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import threading
 from queue import Queue
-from threading import Lock
-from telethon import TelegramClient, events
+from telethon import TelegramClient, errors, events, utils
 import asyncio
 import json
 import os
 import re
+import time
+import uuid
 from datetime import datetime
-from src.views.components.code_dialog import CodeInputDialog
+from src.controllers.async_server import AsyncAPIServer
+from src.models.api_settings import APISettings
+from src.utils.send_scheduler import SendScheduler, QueueFullError
+from src.utils.reply_router import ReplyRouter
+from src.utils.job_store import JobStore
+from src.utils.webhook import WebhookDispatcher
+from src.utils.rate_limiter import AccountRateLimiter, RateLimitedError
+from src.utils.account_balancer import AccountBalancer, PoolNotFoundError
+from src.utils.metrics import MetricsRegistry
+from src.utils.cache_file import load_caches, save_caches
+from src.utils.entity_cache import EntityCache
+from src.utils.outbox import Outbox
+from src.utils.traffic_capture import TrafficCapture
+from src.utils.connection_supervisor import ConnectionSupervisor
+from src.utils.session_store import SessionStore
+from src.utils.message_history import MessageHistory
+from src.utils.media_upload import FileTooLargeError, spool, upload_parts
+from src.utils.media_cache import MediaCache, MediaExpiredError
+from src.utils.message_feed import MessageFeed, FeedFullError, KEEPALIVE_INTERVAL, parse_filter
 
 class APIController:
-    def __init__(self, view):
+    def __init__(self, view, settings=None, client_factory=TelegramClient):
         self.view = view
+        self.settings = settings or APISettings.load()
+        self.client_factory = client_factory  # Builds each account's client; benchmarks pass a stand-in
         self.api_running = False
         self.app = Flask(__name__)
         self.server_thread = None
+        self.async_server = None  # aiohttp server when server_mode is 'asyncio'
         self.loop_thread = None # Thread for the asyncio event loop
         self.loop = None
         self.clients = {}  # Dictionary to store multiple clients
-        self.responses = {}  # Dictionary to store responses for each client
-        self.global_request_lock = Lock() # Global lock for handling send requests one by one
-        self.request_queue = Queue()  # Queue for handling multiple requests
+        self.replies = ReplyRouter()  # Pending reply futures keyed by (phone, chat id)
+        self.scheduler = None  # Per-account send lanes, created with the event loop
+        self.entity_caches = {}  # Resolved destinations per phone
+        self.media_caches = {}  # Uploaded media per phone, keyed by content hash
+        self.file_jobs = {}  # Running /send-file uploads per phone
+        self.jobs = JobStore(self.settings.job_store_size)  # Sends queued with ?async=1
+        self.webhooks = None  # Callback delivery when webhook_url is configured
+        self.outbox = None  # Durable record of accepted sends when outbox_enabled is set
+        self.capture = None  # Recorded /send-message traffic when capture_file is set
+        self.sessions = None  # Shared session database when session_store is 'sqlite'
+        self.history = MessageHistory(self.settings.history_per_chat, self.settings.history_max_chats)
+        self.feed = MessageFeed(self.settings.stream_buffer_size, self.settings.stream_max_subscribers)
+        self.limiters = {}  # Send rate limits and FLOOD_WAIT state per phone
+        self.balancer = AccountBalancer(self.settings.pools, self.settings.balancing_sticky_slack)
+        self.supervisor = ConnectionSupervisor(
+            self.clients,
+            self.settings.supervisor_interval,
+            self.settings.keepalive_idle,
+            self.settings.keepalive_timeout,
+            self.settings.reconnect_backoff,
+            self.settings.reconnect_backoff_max,
+            on_change=self._on_connection_change
+        )
+        self.loop_lag = 0.0  # Last event loop lag sample in seconds
+        self.loop_lag_monitor = None
+        self.credentials = {}  # Credentials of the served accounts by phone (failed ones are left out)
+        self.credentials_retry_at = None  # When the watcher tries accounts that failed to connect again
+        self.credentials_signature = None  # (mtime, size) of credentials_file when last read
+        self.credentials_watcher = None
+        self.reload_lock = None  # Serializes credential reloads, created with the event loop
+        self.draining = set()  # Removed accounts finishing their queued sends
+        self._init_metrics()
         
         # Register Flask routes
         @self.app.route('/send-message', methods=['POST'])
         def send_message():
             return self._handle_send_message()
 
+        @self.app.route('/send-messages', methods=['POST'])
+        def send_messages():
+            return self._handle_send_messages()
+
+        @self.app.route('/send-file', methods=['POST'])
+        def send_file():
+            return self._handle_send_file()
+
+        @self.app.route('/jobs/<job_id>', methods=['GET'])
+        def get_job(job_id):
+            return self._dispatch(self.get_job_async, job_id)
+
+        @self.app.route('/jobs', methods=['GET'])
+        def get_jobs():
+            return self._dispatch(self.get_jobs_async, request.args.get('ids'))
+
+        @self.app.route('/messages', methods=['GET'])
+        def messages():
+            return self._dispatch(self.get_messages_async, request.args)
+
+        @self.app.route('/stream', methods=['GET'])
+        def stream():
+            return self._handle_stream()
+
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics():
+            return self._handle_metrics()
+
+        @self.app.route('/reload', methods=['POST'])
+        def reload():
+            return self._dispatch(self.reload_credentials_async)
+
+        @self.app.route('/stats', methods=['GET'])
+        def stats():
+            return self._dispatch(self.get_stats_async)
+
     def start_api(self):
         """Start the Flask API server"""
         try:
             if not self.api_running:
                 # Load all credentials
-                config_file = os.path.join('config', 'telegram_credentials.json')
-                with open(config_file, 'r') as f:
-                    all_credentials = json.load(f)
+                all_credentials = self._read_credentials()
+                self.credentials = {cred['phone']: cred for cred in all_credentials}
+                self.credentials_retry_at = None
+                
+                # All accounts in one session database instead of a file each
+                if self.settings.session_store == 'sqlite':
+                    self.sessions = SessionStore(self.settings.session_store_file, self.settings.session_flush_interval)
+                    self.sessions.open()
                 
                 # Initialize event loop
                 self.loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(self.loop)
+                self.scheduler = SendScheduler(self.settings.queue_depth)
+                self.reload_lock = asyncio.Lock()
                 
-                # Define event handler factory
-                def create_message_handler(phone_number):
-                    async def handle_new_message(event):
-                        if event.is_private:  # Only handle private messages
-                            self.responses[phone_number] = event.message.text
-                            self.view.log_message(
-                                f"Received response for {phone_number}: {event.message.text}"
-                            )
-                    return handle_new_message
-                
-                # Initialize and start each client
-                for cred in all_credentials:
-                    phone = cred['phone']
-                    self.view.log_message(f"Starting client for {phone}")
-                    
-                    client = TelegramClient(
-                        f'telegram_session_{phone}',
-                        int(cred['api_id']),
-                        cred['api_hash'],
-                        loop=self.loop
-                    )
-                    
-                    # Define code callback for this client
-                    def code_callback():
-                        dialog = CodeInputDialog(
-                            self.view.root,
-                            phone=phone,
-                            api_id=cred['api_id']
-                        )
-                        return dialog.get_code()
-                    
-                    # Start client with code callback
-                    client.start(
-                        phone=phone,
-                        code_callback=code_callback
+                # Warm the entity caches from the previous run
+                self.entity_caches = load_caches(
+                    self.settings.entity_cache_file,
+                    [cred['phone'] for cred in all_credentials],
+                    lambda: EntityCache(
+                        self.settings.entity_cache_size,
+                        self.settings.entity_cache_ttl,
+                        self.settings.entity_cache_negative_ttl
                     )
-                    
-                    # Add message handler for this client
-                    handler = create_message_handler(phone)
-                    client.add_event_handler(handler, events.NewMessage)
-                    
-                    # Store client in dictionary
-                    self.clients[phone] = client
-                    self.view.log_message(f"Client authenticated for {phone}")
+                )
+                self.media_caches = load_caches(
+                    self.settings.media_cache_file,
+                    [cred['phone'] for cred in all_credentials],
+                    lambda: MediaCache(self.settings.media_cache_size)
+                )
                 
                 # Start the asyncio event loop in a separate thread
                 self.loop_thread = threading.Thread(target=self._run_loop)
                 self.loop_thread.daemon = True
                 self.loop_thread.start()
                 
-                # Start Flask in a separate thread
-                self.server_thread = threading.Thread(target=self._run_server)
-                self.server_thread.daemon = True
-                self.server_thread.start()
+                self.loop_lag_monitor = asyncio.run_coroutine_threadsafe(self._monitor_loop_lag(), self.loop)
+                
+                # Sends left unfinished by the previous run are replayed once the clients are up
+                unfinished = []
+                if self.settings.outbox_enabled:
+                    self.outbox = Outbox(
+                        self.settings.outbox_file,
+                        self.settings.outbox_batch_size,
+                        self.settings.outbox_retention
+                    )
+                    unfinished = self.outbox.open()
+                
+                if self.settings.capture_file:
+                    self.capture = TrafficCapture(self.settings.capture_file)
+                    self.capture.open()
+                
+                # Deliver send results and replies to the callback URL, if configured
+                if self.settings.webhook_url:
+                    self.webhooks = WebhookDispatcher(
+                        self.settings.webhook_url,
+                        self.settings.webhook_batch_size,
+                        self.settings.webhook_flush_interval,
+                        self.settings.webhook_max_retries,
+                        self.settings.webhook_retry_backoff,
+                        self.settings.webhook_queue_size,
+                        self.settings.webhook_timeout,
+                        self.view.log_message
+                    )
+                    asyncio.run_coroutine_threadsafe(self.webhooks.start(), self.loop).result()
+                
+                if self.settings.server_mode == 'asyncio':
+                    # Serve requests as coroutines on the client event loop
+                    self.async_server = AsyncAPIServer(self, self.settings.host, self.settings.port)
+                    asyncio.run_coroutine_threadsafe(self.async_server.start(), self.loop).result()
+                else:
+                    # Start Flask in a separate thread
+                    self.server_thread = threading.Thread(target=self._run_server)
+                    self.server_thread.daemon = True
+                    self.server_thread.start()
+                
+                # Connect authorized sessions concurrently; each account is served as soon as it is ready
+                self.view.log_message(f"Connecting {len(all_credentials)} clients...")
+                needs_login = asyncio.run_coroutine_threadsafe(
+                    self._connect_clients(all_credentials), self.loop
+                ).result()
+                
+                # Accounts without a valid session ask the view for a login code one by one
+                for cred, client in needs_login:
+                    self._login_interactive(cred, client)
+                
+                # Keep the connections alive from now on
+                asyncio.run_coroutine_threadsafe(self.supervisor.start(), self.loop).result()
+                
+                # Apply later edits of the credentials file without a restart
+                if self.settings.credentials_watch_interval:
+                    self.credentials_watcher = asyncio.run_coroutine_threadsafe(
+                        self._watch_credentials(), self.loop
+                    )
+                
+                if unfinished:
+                    asyncio.run_coroutine_threadsafe(self._replay_outbox(unfinished), self.loop).result()
                 
                 self.api_running = True
                 self.view.update_api_status("Running", "green")  # Update status here
@@ -105,11 +227,241 @@ class APIController:
             self.view.log_message(f"Error starting API: {str(e)}", 'error')
             raise
 
+    def _create_message_handler(self, phone_number):
+        """Build the NewMessage handler of one account"""
+        async def handle_new_message(event):
+            if event.out:
+                return
+            message = {
+                'phone': phone_number,
+                'chat_id': event.chat_id,
+                'sender_id': event.sender_id,
+                'sender_username': getattr(event.sender, 'username', None),  # Only if already known
+                'message_id': event.message.id,
+                'text': event.message.text,
+                'date': event.message.date.isoformat() if event.message.date else None,
+                'is_private': event.is_private
+            }
+            self.history.record(
+                phone_number, event.chat_id, 'in', event.message.id, event.message.text,
+                sender_id=event.sender_id, date=event.message.date
+            )
+            # Every inbound message goes to /stream subscribers
+            self.feed.publish(message)
+            if event.is_private:  # Only private messages answer pending requests
+                matched = self.replies.dispatch(phone_number, event.chat_id, event.message.text)
+                self._notify('message', matched=matched, **message)
+                self.view.log_message(
+                    f"Received response for {phone_number} from {event.chat_id}"
+                    f"{'' if matched else ' (no pending request)'}: {event.message.text}"
+                )
+        return handle_new_message
+
+    def _register_client(self, phone, client):
+        """Attach the message handler and start serving requests for this account"""
+        client.add_event_handler(self._create_message_handler(phone), events.NewMessage)
+        self.clients[phone] = client
+
+    async def _connect_clients(self, credentials):
+        """Connect all accounts concurrently (capped), returning those that still need a login code"""
+        semaphore = asyncio.Semaphore(self.settings.startup_concurrency)
+        needs_login = []
+        
+        async def connect(cred):
+            phone = cred['phone']
+            async with semaphore:
+                started = time.monotonic()
+                self.view.log_message(f"Starting client for {phone}")
+                try:
+                    session = f'telegram_session_{phone}'
+                    client = self.client_factory(
+                        self.sessions.session(session) if self.sessions else session,
+                        int(cred['api_id']),
+                        cred['api_hash'],
+                        loop=self.loop,
+                        flood_sleep_threshold=0  # FLOOD_WAIT is handled by the rate limiter
+                    )
+                    await client.connect()
+                    if not await client.is_user_authorized():
+                        self.view.log_message(f"Client for {phone} needs a login code")
+                        needs_login.append((cred, client))
+                        return
+                except Exception as e:
+                    self.view.log_message(f"Error starting client for {phone}: {str(e)}", 'error')
+                    self._drop_credentials(phone, retry=True)
+                    return
+                self._register_client(phone, client)
+                self.view.log_message(
+                    f"Client authenticated for {phone} in {time.monotonic() - started:.2f}s"
+                )
+        
+        started = time.monotonic()
+        await asyncio.gather(*(connect(cred) for cred in credentials))
+        connected = sum(cred['phone'] in self.clients for cred in credentials)
+        self.view.log_message(
+            f"Connected {connected}/{len(credentials)} clients in {time.monotonic() - started:.2f}s"
+        )
+        return needs_login
+
+    def _drop_credentials(self, phone, retry=False):
+        """Forget an account that could not be started, so the next reload adds it again (runs on the loop).
+
+        With `retry` (a connection error) the watcher reloads on its own after
+        reconnect_backoff_max seconds; failed logins wait for a change or /reload.
+        """
+        self.credentials.pop(phone, None)
+        if retry and self.credentials_retry_at is None:
+            self.credentials_retry_at = time.monotonic() + self.settings.reconnect_backoff_max
+
+    def _read_credentials(self):
+        """Accounts listed in credentials_file; remembers the file's signature for the watcher"""
+        path = self.settings.credentials_file
+        stat = os.stat(path)
+        self.credentials_signature = (stat.st_mtime_ns, stat.st_size)
+        with open(path, 'r') as f:
+            credentials = json.load(f)
+        if not isinstance(credentials, list) or not all(isinstance(cred, dict) and cred.get('phone') for cred in credentials):
+            raise ValueError('Expected a list of accounts with phone, api_id and api_hash')
+        return credentials
+
+    async def _watch_credentials(self):
+        """Reload the credentials whenever credentials_file changes"""
+        while True:
+            await asyncio.sleep(self.settings.credentials_watch_interval)
+            try:
+                stat = os.stat(self.settings.credentials_file)
+            except OSError:
+                continue
+            if (stat.st_mtime_ns, stat.st_size) != self.credentials_signature:
+                self.view.log_message("Credentials file changed, reloading")
+                await self.reload_credentials_async()
+            elif self.credentials_retry_at is not None and time.monotonic() >= self.credentials_retry_at:
+                self.view.log_message("Retrying accounts that failed to connect")
+                await self.reload_credentials_async()
+
+    async def reload_credentials_async(self):
+        """Apply the changes of credentials_file, returning (body, status).
+
+        Only the difference is applied, in the background: added accounts are
+        connected, removed ones stop taking requests, finish their queued sends
+        and disconnect, and accounts whose api_id/api_hash changed are replaced.
+        Other accounts are not touched.
+        """
+        async with self.reload_lock:
+            try:
+                credentials = {cred['phone']: cred for cred in self._read_credentials()}
+            except (OSError, ValueError) as e:
+                self.view.log_message(f"Could not reload credentials: {str(e)}", 'error')
+                return {'error': 'Invalid credentials file', 'message': str(e)}, 400
+            self.credentials_retry_at = None
+            # Compared with the accounts served, so accounts that failed to start are added again
+            added = [cred for phone, cred in credentials.items() if phone not in self.credentials]
+            removed = [phone for phone in self.credentials if phone not in credentials]
+            changed = [
+                cred for phone, cred in credentials.items()
+                if phone in self.credentials and cred != self.credentials[phone]
+            ]
+            self.credentials = credentials
+            body = {
+                'added': [cred['phone'] for cred in added],
+                'removed': removed,
+                'changed': [cred['phone'] for cred in changed],
+                'unchanged': len(credentials) - len(added) - len(changed)
+            }
+            if not (added or removed or changed):
+                return body, 200
+            
+            self.view.log_message(
+                f"Reloading credentials: {len(added)} added, {len(removed)} removed, {len(changed)} changed"
+            )
+            # Removed and replaced accounts refuse new requests from now on
+            self.draining.update(removed)
+            self.draining.update(body['changed'])
+            asyncio.ensure_future(asyncio.gather(
+                self._add_accounts(added),
+                *(self._remove_account(phone) for phone in removed),
+                *(self._replace_account(cred) for cred in changed)
+            ))
+            return body, 202
+
+    async def _add_accounts(self, credentials):
+        """Connect accounts added while running; login codes are asked for one at a time"""
+        if not credentials:
+            return
+        needs_login = await self._connect_clients(credentials)
+        for cred, client in needs_login:
+            await self.loop.run_in_executor(None, self._login_interactive, cred, client)
+
+    async def _remove_account(self, phone):
+        """Let the account finish its queued sends, then disconnect and forget it"""
+        self.view.log_message(f"Removing {phone} after {self.scheduler.depth(phone)} queued sends")
+        await self.scheduler.remove(phone)
+        client = self.clients.pop(phone, None)
+        self.supervisor.forget(phone)
+        self.limiters.pop(phone, None)
+        self.draining.discard(phone)
+        if client:
+            try:
+                await client.disconnect()
+            except Exception as e:
+                self.view.log_message(f"Error disconnecting client for {phone}: {str(e)}", 'error')
+        self.view.log_message(f"Removed {phone}")
+
+    async def _replace_account(self, cred):
+        """Reconnect an account whose api_id or api_hash changed"""
+        await self._remove_account(cred['phone'])
+        await self._add_accounts([cred])
+
+    def _login_interactive(self, cred, client):
+        """Sign in an account with a code obtained from the view (runs on the calling thread)"""
+        phone = cred['phone']
+        started = time.monotonic()
+        try:
+            asyncio.run_coroutine_threadsafe(client.send_code_request(phone), self.loop).result()
+            code = self.view.request_login_code(phone, cred['api_id'])
+            if not code:
+                raise ValueError("No login code provided")
+            try:
+                asyncio.run_coroutine_threadsafe(client.sign_in(phone, code), self.loop).result()
+            except errors.SessionPasswordNeededError:
+                password = self.view.request_password(phone)
+                if not password:
+                    raise ValueError("No two-step verification password provided")
+                asyncio.run_coroutine_threadsafe(client.sign_in(password=password), self.loop).result()
+        except Exception as e:
+            self.view.log_message(f"Error signing in {phone}: {str(e)}", 'error')
+            asyncio.run_coroutine_threadsafe(client.disconnect(), self.loop).result()
+            self.loop.call_soon_threadsafe(self._drop_credentials, phone)
+            return
+        self._register_client(phone, client)
+        self.view.log_message(f"Client authenticated for {phone} in {time.monotonic() - started:.2f}s")
+
     def stop_api(self):
         """Stop the Flask API server"""
         try:
                 # Stop the asyncio event loop first
                 if self.loop and self.loop.is_running():
+                    # End open /stream connections so the servers can shut down right away
+                    self.loop.call_soon_threadsafe(self.feed.close)
+                    if self.async_server:
+                        asyncio.run_coroutine_threadsafe(self.async_server.stop(), self.loop).result(timeout=5)
+                        self.async_server = None
+                    if self.loop_lag_monitor:
+                        self.loop_lag_monitor.cancel()
+                        self.loop_lag_monitor = None
+                    if self.credentials_watcher:
+                        self.credentials_watcher.cancel()
+                        self.credentials_watcher = None
+                    # Stop the send lanes so queued requests fail instead of hanging
+                    if self.scheduler:
+                        asyncio.run_coroutine_threadsafe(self.scheduler.close(), self.loop).result(timeout=5)
+                    # Stop reconnecting, then close every connection
+                    asyncio.run_coroutine_threadsafe(self.supervisor.stop(), self.loop).result(timeout=5)
+                    asyncio.run_coroutine_threadsafe(self._disconnect_clients(), self.loop).result(timeout=15)
+                    # Flush pending webhook events
+                    if self.webhooks:
+                        asyncio.run_coroutine_threadsafe(self.webhooks.close(), self.loop).result(timeout=15)
+                        self.webhooks = None
                     self.view.log_message("Stopping asyncio event loop...")
                     self.loop.call_soon_threadsafe(self.loop.stop) # Request loop stop
                 if self.loop_thread:
@@ -118,9 +470,28 @@ class APIController:
                         self.view.log_message("Event loop thread did not stop gracefully.", 'warning')
                 self.loop = None # Clear the loop reference
 
-                # Shutdown all clients
-                for phone, client in self.clients.items():
-                    self.view.log_message(f"Disconnecting client for {phone}")
+                # Commit the last outbox updates; unsent entries stay pending for the next start
+                if self.outbox:
+                    self.outbox.close()
+                    self.outbox = None
+                if self.capture:
+                    self.capture.close()
+                    self.capture = None
+                # Write the session changes made up to the disconnect
+                if self.sessions:
+                    self.sessions.close()
+                    self.sessions = None
+
+                # Persist resolved entities so the next start is warm
+                if self.entity_caches:
+                    save_caches(self.settings.entity_cache_file, self.entity_caches)
+                if self.media_caches:
+                    save_caches(self.settings.media_cache_file, self.media_caches)
+
+                # Clients are connected again by the next start_api
+                self.clients.clear()
+                self.supervisor.health.clear()
+                self.draining.clear()
                 # Stop Flask server
                 self.api_running = False
                 self.view.update_api_status("Stopped", "red")  # Update status here
@@ -130,9 +501,24 @@ class APIController:
             self.view.log_message(f"Error stopping API: {str(e)}", 'error')
             raise
 
+    async def _disconnect_clients(self):
+        """Disconnect every client concurrently"""
+        async def disconnect(phone, client):
+            self.view.log_message(f"Disconnecting client for {phone}")
+            try:
+                await client.disconnect()
+            except Exception as e:
+                self.view.log_message(f"Error disconnecting client for {phone}: {str(e)}", 'error')
+        await asyncio.gather(*(disconnect(phone, client) for phone, client in self.clients.items()))
+
+    def _on_connection_change(self, phone, state, reason):
+        level = 'info' if state == 'connected' else 'warning'
+        self.view.log_message(f"Connection of {phone} is {state}{f' ({reason})' if reason else ''}", level)
+        self._notify('connection', phone=phone, state=state, reason=reason)
+
     def _run_server(self):
         """Run Flask server in thread"""
-        self.app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+        self.app.run(host=self.settings.host, port=self.settings.port, debug=False, use_reloader=False)
 
     def _run_loop(self):
         """Run the asyncio event loop."""
@@ -146,158 +532,1043 @@ class APIController:
 
     def _handle_send_message(self):
         """Handle send message request"""
-        # Acquire the global lock before processing the request
-        # Wait indefinitely until the lock is available to ensure sequential processing
-        self.view.log_message("Attempting to acquire global request lock...")
-        self.global_request_lock.acquire()
-        self.view.log_message("Global request lock acquired.")
         try:
             data = request.json
+        except Exception as e:
+            return self._error_response(e)
+        return self._dispatch(
+            self.send_message_async, data, False, self.is_flag_set(request.args.get('async'))
+        )
+
+    def _dispatch(self, handler, *args):
+        """Run an async API handler on the event loop for a Flask request thread"""
+        try:
+            future = asyncio.run_coroutine_threadsafe(handler(*args), self.loop)
+            body, status = future.result()
+            return jsonify(body), status
+        except Exception as e:
+            return self._error_response(e)
+
+    def _error_response(self, e):
+        """Flask response for an unexpected error"""
+        error_msg = f"Error processing request: {str(e)}"
+        self.view.log_message(error_msg, 'error')
+        return jsonify({
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+    async def send_message_async(self, data, wait_for_lane=False, run_async=False):
+        """Process a send-message payload on the event loop, returning (body, status).
+
+        With `wait_for_lane` (used by batches) a full account lane is waited on
+        instead of rejected, and the request timeout does not apply. With
+        `run_async` the send is queued as a job and 202 is returned right away.
+        """
+        received_at = time.time()
+        started = time.monotonic()
+        body, status = await self._process_send_message(data, wait_for_lane, run_async)
+        latency = time.monotonic() - started
+        self.metric_requests.inc(str(status))
+        self.metric_request_seconds.observe(latency)
+        # Batch items are not captured, they arrive together in one /send-messages call
+        if self.capture and not wait_for_lane and isinstance(data, dict):
+            self.capture.record(data, run_async, received_at, status, latency, body)
+        return body, status
+
+    async def _process_send_message(self, data, wait_for_lane, run_async):
+        try:
             self.view.log_message(f"Received send-message request: {json.dumps(data)}")
             
+            started = time.monotonic()
+            error = self._validate_send_request(data)
+            if error:
+                return error
+            
             destination = data.get('destination')
             message = data.get('message')
             phone = data.get('phone')
             
-            # Validate required parameters
-            if not all([destination, message, phone]):
-                error_msg = f"Missing parameters in request. Required: destination, message, phone. Received: {data}"
-                self.view.log_message(error_msg, 'error')
-                return jsonify({
-                    'error': 'Missing parameters',
-                    'required': ['destination', 'message', 'phone']
-                }), 400
+            if phone not in self.clients:
+                phone, error = self._select_phone(phone, destination)
+                if error:
+                    return error
+            error = self._check_connection(phone)
+            if error:
+                return error
+            self.metric_stage_seconds.observe(time.monotonic() - started, 'validate')
             
-            # Validate phone number format
-            if not phone.startswith('+'):
-                error_msg = f"Invalid phone format: {phone}"
-                self.view.log_message(error_msg, 'error')
-                return jsonify({
-                    'error': 'Invalid phone number format',
-                    'expected': 'Phone number must start with "+" (e.g. +84123456789)'
-                }), 400
+            self.view.log_message(f"Queueing message to {destination} using {phone}")
             
-            # Check if phone number exists
-            if phone not in self.clients:
-                available_phones = list(self.clients.keys())
-                error_msg = f"Phone {phone} not found. Available phones: {available_phones}"
-                self.view.log_message(error_msg, 'warning')
-                return jsonify({
-                    'error': 'Phone number not found',
-                    'message': f'Phone number {phone} is not registered',
-                    'available_phones': available_phones
-                }), 404
+            # Accepted sends are committed to the outbox before they are queued
+            outbox_id = None
+            if self.outbox:
+                outbox_id = uuid.uuid4().hex
+                await self.outbox.add(outbox_id, phone, destination, message)
             
-            try:
-                # Clear any previous response
-                self.responses[phone] = None
-                self.view.log_message(f"Sending message to {destination} using {phone}")
+            if run_async:
+                return self._enqueue_job(phone, destination, message, outbox_id)
             
-                # Send message and wait for response
-                async def send_and_wait():
-                    destination_id = None # Initialize destination_id
-                    try:
-                        # Resolve destination to entity/ID *before* sending
-                        try:
-                            # Use get_entity which works with usernames, phone numbers, or IDs
-                            entity = await self.clients[phone].get_entity(destination)
-                            destination_id = entity.id
-                            self.view.log_message(f"Resolved destination '{destination}' to ID: {destination_id}")
-                        except ValueError: # Handle case where destination is not found
-                            self.view.log_message(f"Could not find entity for destination: {destination}", 'error')
-                            return {
-                                'success': False,
-                                'error': 'Destination not found',
-                                'message': f'Could not resolve Telegram entity for {destination}',
-                                'phone': phone,
-                                'timestamp': datetime.now().isoformat()
-                            }
-                        except Exception as e: # Catch other potential errors during entity resolution
-                            self.view.log_message(f"Error resolving entity {destination}: {str(e)}", 'error')
-                            raise # Re-raise to be caught by the outer handler which returns 500
-
-                        # Clear previous response before sending
-                        self.responses[phone] = None
-                        
-                        # Send message using the resolved entity ID
-                        await self.clients[phone].send_message(destination_id, message)
-                        sent_time = datetime.now()
-                        self.view.log_message(f"Message sent to {destination} (ID: {destination_id}) at {sent_time}")
-                        
-                        # Wait for the full timeout period, allowing the handler to update the response
-                        timeout_seconds = 10
-                        elapsed_time = 0
-                        while elapsed_time < timeout_seconds:
-                            await asyncio.sleep(1) # Check every second
-                            elapsed_time = (datetime.now() - sent_time).seconds
-                            # Optional: Log waiting progress
-                            # self.view.log_message(f"Waiting for response... {elapsed_time}/{timeout_seconds}s elapsed.")
-                        
-                        # After waiting, check the final response captured by the handler
-                        final_response_data = self.responses.get(phone) # Use .get for safety
-                        response_time = (datetime.now() - sent_time).total_seconds() # Use total_seconds for precision
-                        final_response_text = None
-                        # status = 'timeout' # Default status
-
-                        # if final_response_data is not None:
-                        #     response_sender_id, response_text = final_response_data
-                        #     # Check if the response came from the intended destination
-                        #     if response_sender_id == destination_id:
-                        #         final_response_text = response_text
-                        #         status = 'received'
-                        #         self.view.log_message(
-                        #             f"Matching response received from {destination} (ID: {destination_id}) within {timeout_seconds}s: {final_response_text}"
-                        #         )
-                        #     else:
-                        #         # A response was received, but from someone else
-                        #         status = 'received_other'
-                        #         self.view.log_message(
-                        #             f"Response received within {timeout_seconds}s, but from unexpected sender (ID: {response_sender_id}) instead of {destination_id}. Message: {response_text}",
-                        #             'warning'
-                        #         )
-                        # else:
-                        #     self.view.log_message(
-                        #         f"No response received from {destination} (ID: {destination_id}) after {timeout_seconds} seconds",
-                        #         'warning'
-                        #     )
-
-                        return {
-                            'success': True, # Message sending itself was successful (unless get_entity failed)
-                            'message': f'Message sent to {destination}',
-                            'phone': phone,
-                            'timestamp': datetime.now().isoformat(),
-                            'response_time': response_time,
-                            'response': final_response_data,
-                        }
-                    except Exception as e:
-                        self.view.log_message(f"Error in send_and_wait: {str(e)}", 'error')
-                        # Ensure response is cleared on error too
-                        self.responses[phone] = None
-                        raise
-                
-                future = asyncio.run_coroutine_threadsafe(send_and_wait(), self.loop)
-                # Add a timeout to future.result() to prevent indefinite blocking
-                try:
-                    # Wait for max 40 seconds (slightly longer than internal timeout)
-                    result = future.result(timeout=40) 
-                    self.view.log_message(f"Request completed: {json.dumps(result)}")
-                except TimeoutError:
-                    self.view.log_message("Coroutine execution timed out.", 'error')
-                    return jsonify({'error': 'Request timed out', 'message': 'The Telegram operation took too long.'}), 504 # Gateway Timeout
-                # Return 200 OK even if destination lookup failed, as the error is in the result JSON
-                return jsonify(result), 200 if result.get('success') is not False else 404                
-            except Exception as e:
-                raise e;
+            # Requests for the same phone run in order on its lane, other phones run in parallel
+            job_started = False
+            
+            def lane_job():
+                nonlocal job_started
+                job_started = True
+                return self._send_and_wait(phone, destination, message, queued_at=queued_at, outbox_id=outbox_id)
+            
+            try:
+                # Wait longer than the reply timeout to leave room for queueing and sending
+                queued_at = time.monotonic()
+                submission = self.scheduler.submit(phone, lane_job, wait=wait_for_lane)
+                if wait_for_lane:
+                    result = await self._sent_result(submission)
+                else:
+                    result = await asyncio.wait_for(self._sent_result(submission), self.settings.request_timeout)
+                self.view.log_message(f"Request completed: {json.dumps(result)}")
+            except asyncio.TimeoutError:
+                self.view.log_message("Coroutine execution timed out.", 'error')
+                if not job_started:
+                    # The lane skips it, so it is never sent; the caller retries instead of a replay
+                    self._mark_outbox(outbox_id, 'failed')
+                return {'error': 'Request timed out', 'message': 'The Telegram operation took too long.'}, 504 # Gateway Timeout
+            except QueueFullError as e:
+                self._mark_outbox(outbox_id, 'failed')
+                return self._queue_full_response(e)
+            except RateLimitedError as e:
+                return self._rate_limited_response(e)
+            # Return 200 OK even if destination lookup failed, as the error is in the result JSON
+            return result, self._result_status(result)
         except Exception as e:
             error_msg = f"Error processing request: {str(e)}"
             self.view.log_message(error_msg, 'error')
-            return jsonify({
+            return {
                 'error': str(e),
                 'type': type(e).__name__
-            }), 500
+            }, 500
+
+    @staticmethod
+    def _result_status(result):
+        return 200 if result.get('success') is not False else 404
+
+    def _queue_full_response(self, e):
+        self.view.log_message(str(e), 'warning')
+        return {
+            'error': 'Queue full',
+            'message': str(e),
+            'phone': e.phone,
+            'queue_depth': self.settings.queue_depth
+        }, 429
+
+    def _rate_limited_response(self, e):
+        self.view.log_message(str(e), 'warning')
+        return {
+            'error': 'Rate limited',
+            'message': str(e),
+            'phone': e.phone,
+            'reason': e.reason,
+            'retry_after': round(e.retry_after, 1)
+        }, 429
+
+    def _enqueue_job(self, phone, destination, message, outbox_id=None):
+        """Queue a send as a background job and return its id with 202"""
+        # The outbox entry and the job share their id so a replayed job can still be looked up
+        job = self.jobs.create(job_id=outbox_id, phone=phone, destination=destination)
+        queued_at = time.monotonic()
+        try:
+            self.scheduler.enqueue(
+                phone, lambda: self._run_job(job, phone, destination, message, queued_at, outbox_id)
+            )
+        except QueueFullError as e:
+            self.jobs.discard(job)
+            self._mark_outbox(outbox_id, 'failed')
+            return self._queue_full_response(e)
+        self.view.log_message(f"Queued job {job.id} for {destination} using {phone}")
+        return {
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/jobs/{job.id}'
+        }, 202
+
+    async def _run_job(self, job, phone, destination, message, queued_at, outbox_id=None):
+        """Lane job for async mode; records the outcome in the job store instead of raising"""
+        self.jobs.start(job)
+        try:
+            pending = await self._send_and_wait(
+                phone, destination, message, job_id=job.id, queued_at=queued_at, outbox_id=outbox_id
+            )
+        except Exception as e:
+            self._finish_job(job, e)
+            return
+        # The lane moves on while the reply is awaited
+        pending.add_done_callback(
+            lambda task: task.cancelled() or self._finish_job(job, task.exception() or task.result())
+        )
+
+    def _finish_job(self, job, outcome):
+        """Record a send job's result, or the exception it failed with"""
+        if isinstance(outcome, RateLimitedError):
+            self.jobs.finish(job, *self._rate_limited_response(outcome))
+        elif isinstance(outcome, Exception):
+            self.jobs.finish(job, {'error': str(outcome), 'type': type(outcome).__name__}, 500)
+        else:
+            self.jobs.finish(job, outcome, self._result_status(outcome))
+        self.view.log_message(f"Job {job.id} {job.status}")
+
+    def _handle_send_file(self):
+        """Handle send-file request (multipart form or raw body)"""
+        upload = request.files.get('file')
+        fields = dict(request.args)
+        fields.update(request.form.items())
+        fields.setdefault('content_hash', request.headers.get('X-Content-SHA256'))
+        try:
+            if upload:
+                # Copied out of the request so an async job can outlive it
+                source, size, digest = spool(upload.stream.read, self.settings.media_max_size)
+                fields.setdefault('file_name', upload.filename)
+                fields.setdefault('mime_type', upload.mimetype)
+            else:
+                source, size, digest = spool(request.stream.read, self.settings.media_max_size)
+                fields.setdefault('mime_type', request.mimetype)
+        except FileTooLargeError as e:
+            return jsonify({'error': 'File too large', 'message': str(e)}), 413
+        return self._dispatch(
+            self.send_file_async, fields, source, size, digest, self.is_flag_set(request.args.get('async'))
+        )
+
+    async def send_file_async(self, fields, source, size, digest, run_async=False):
+        """Upload a spooled file and send it, returning (body, status); closes `source` (may be None).
+
+        `fields` holds phone, destination and the optional caption, file_name,
+        mime_type, force_document and content_hash (SHA-256 hex). Content sent
+        before by the account is not uploaded again; with a known content_hash
+        the body may even be left empty. With `run_async` the upload runs as a
+        job reporting its progress and 202 is returned right away.
+        """
+        try:
+            self.view.log_message(f"Received send-file request for {size} bytes: {json.dumps(fields)}")
+            declared_hash = (fields.get('content_hash') or '').strip().lower() or None
+            if source and not size:
+                source.close()
+                source = None
+            error = self._validate_send_request(fields, required=('destination',))
+            if not error and source and declared_hash and declared_hash != digest:
+                error = {'error': 'Content hash mismatch', 'message': f'The file has SHA-256 {digest}'}, 400
+            phone = fields.get('phone')
+            destination = fields.get('destination')
+            if not error and phone not in self.clients:
+                phone, error = self._select_phone(phone, destination)
+            if not error:
+                error = self._check_connection(phone)
+            cache_key = self._media_key(digest if source else declared_hash, fields)
+            if not error and source is None and (cache_key is None or cache_key not in self._get_media_cache(phone)):
+                error = {
+                    'error': 'Empty file',
+                    'message': 'The request did not contain any file data and no upload matches its content_hash'
+                }, 400
+            if error:
+                if source:
+                    source.close()
+                return error
+            
+            # Uploads run outside the lane, so their number is capped here instead of by queue_depth
+            running = self.file_jobs.get(phone, 0)
+            if running >= self.settings.media_max_jobs:
+                if source:
+                    source.close()
+                self.view.log_message(f"Rejected file send for {phone}: {running} already running", 'warning')
+                return {
+                    'error': 'Too many file jobs',
+                    'message': f'{phone} already runs {running} file jobs',
+                    'phone': phone,
+                    'media_max_jobs': self.settings.media_max_jobs
+                }, 429
+            self.file_jobs[phone] = running + 1
+            
+            if run_async:
+                job = self.jobs.create(phone=phone, destination=destination, file_name=fields.get('file_name'))
+                self.jobs.set_progress(job, 0, size)
+                task = asyncio.ensure_future(self._run_file_job(job, phone, destination, fields, source, size, cache_key))
+                task.add_done_callback(lambda _: self._file_job_done(phone))
+                self.view.log_message(f"Queued file job {job.id} for {destination} using {phone}")
+                return {'job_id': job.id, 'status': job.status, 'status_url': f'/jobs/{job.id}'}, 202
+            
+            try:
+                result = await self._upload_and_send(phone, destination, fields, source, size, cache_key=cache_key)
+            except RateLimitedError as e:
+                return self._rate_limited_response(e)
+            except MediaExpiredError as e:
+                return self._media_expired_response(e)
+            finally:
+                self._file_job_done(phone)
+            return result, self._result_status(result)
+        except Exception as e:
+            self.view.log_message(f"Error processing send-file request: {str(e)}", 'error')
+            return {'error': str(e), 'type': type(e).__name__}, 500
+
+    def _media_key(self, content_hash, fields):
+        """Media cache key: the same content sent as a document and as a photo are different media"""
+        if not content_hash:
+            return None
+        return f"{content_hash}:{'document' if self.is_flag_set(fields.get('force_document')) else 'media'}"
+
+    def _media_expired_response(self, e):
+        self.view.log_message(str(e), 'warning')
+        return {'error': 'Cached media expired', 'message': str(e)}, 409
+
+    def _get_media_cache(self, phone):
+        cache = self.media_caches.get(phone)
+        if cache is None:
+            cache = self.media_caches[phone] = MediaCache(self.settings.media_cache_size)
+        return cache
+
+    def _file_job_done(self, phone):
+        running = self.file_jobs.get(phone, 0) - 1
+        if running > 0:
+            self.file_jobs[phone] = running
+        else:
+            self.file_jobs.pop(phone, None)
+
+    async def _run_file_job(self, job, phone, destination, fields, source, size, cache_key=None):
+        """Background file send; records progress and outcome in the job store"""
+        self.jobs.start(job)
+        try:
+            result = await self._upload_and_send(phone, destination, fields, source, size, job=job, cache_key=cache_key)
+            self.jobs.finish(job, result, self._result_status(result))
+        except RateLimitedError as e:
+            self.jobs.finish(job, *self._rate_limited_response(e))
+        except MediaExpiredError as e:
+            self.jobs.finish(job, *self._media_expired_response(e))
+        except Exception as e:
+            self.jobs.finish(job, {'error': str(e), 'type': type(e).__name__}, 500)
+        self.view.log_message(f"Job {job.id} {job.status}")
+
+    async def _upload_and_send(self, phone, destination, fields, source, size, job=None, cache_key=None):
+        """Upload the file parts in parallel, then send the media on the account's lane.
+
+        Media cached under `cache_key` is sent without uploading; if Telegram
+        rejects its file reference the entry is dropped and the file uploaded
+        again (MediaExpiredError when there is no file).
+        """
+        client = self.clients[phone]
+        cache = self._get_media_cache(phone)
+        file_name = fields.get('file_name') or 'file'
+        try:
+            media = cache.get(cache_key) if cache_key else None
+            if media is not None:
+                try:
+                    result = await self.scheduler.submit(
+                        phone, lambda: self._send_media(phone, destination, media, fields), wait=True
+                    )
+                    result.update(file_name=file_name, size=size, cached=True)
+                    self._notify('send_result', phone=phone, destination=destination, job_id=job.id if job else None, result=result)
+                    return result
+                except (errors.FileReferenceExpiredError, errors.FileReferenceInvalidError, errors.MediaEmptyError) as e:
+                    cache.invalidate(cache_key)
+                    self.view.log_message(f"Cached media for {phone} rejected ({type(e).__name__}), uploading again", 'warning')
+                    if source is None:
+                        raise MediaExpiredError(cache_key)
+            
+            started = time.monotonic()
+            # Uploading does not count against the send limits, so it runs outside the lane
+            input_file = await upload_parts(
+                lambda part_request: self._call_with_flood_wait(phone, lambda: client(part_request)),
+                source, size, file_name, self.settings.media_upload_parallel,
+                progress=(lambda uploaded, total: self.jobs.set_progress(job, uploaded, total)) if job else None
+            )
+        finally:
+            if source:
+                source.close()
+        upload_time = time.monotonic() - started
+        self.view.log_message(f"Uploaded {file_name} ({size} bytes) for {phone} in {upload_time:.2f}s")
+        
+        result = await self.scheduler.submit(
+            phone, lambda: self._send_media(phone, destination, input_file, fields, cache_key), wait=True
+        )
+        result.update(file_name=file_name, size=size, cached=False, upload_time=round(upload_time, 3))
+        self._notify('send_result', phone=phone, destination=destination, job_id=job.id if job else None, result=result)
+        return result
+
+    async def _send_media(self, phone, destination, media, fields, cache_key=None):
+        """Send uploaded media to a destination (runs on the account's lane)"""
+        try:
+            entity = await self._call_with_flood_wait(phone, lambda: self._resolve_destination(phone, destination))
+        except ValueError:
+            self.view.log_message(f"Could not find entity for destination: {destination}", 'error')
+            return {
+                'success': False,
+                'error': 'Destination not found',
+                'message': f'Could not resolve Telegram entity for {destination}',
+                'phone': phone,
+                'timestamp': datetime.now().isoformat()
+            }
+        destination_id = await self.clients[phone].get_peer_id(entity)
+        limiter = self._get_limiter(phone)
+        
+        async def send():
+            await limiter.acquire(destination_id)
+            return await self.clients[phone].send_file(
+                entity, media,
+                caption=fields.get('caption') or None,
+                force_document=self.is_flag_set(fields.get('force_document')),
+                mime_type=fields.get('mime_type') or None
+            )
+        
+        sent = await self._call_with_flood_wait(phone, send)
+        if cache_key and sent.media:
+            # Later sends of the same content reuse the uploaded file
+            self._get_media_cache(phone).put(cache_key, utils.get_input_media(sent.media))
+        self.history.record(phone, destination_id, 'out', sent.id, fields.get('caption'), date=sent.date)
+        self.view.log_message(f"File sent to {destination} (ID: {destination_id}) using {phone}")
+        return {
+            'success': True,
+            'message': f'File sent to {destination}',
+            'phone': phone,
+            'message_id': sent.id,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    async def _replay_outbox(self, entries):
+        """Queue the outbox entries left unfinished by the previous run as async jobs"""
+        by_phone = {}
+        for entry in entries:
+            if entry['phone'] not in self.clients:
+                # Kept pending so it is replayed once the account is back
+                self.view.log_message(f"Outbox entry {entry['id']} not replayed: {entry['phone']} is not connected", 'warning')
+                continue
+            by_phone.setdefault(entry['phone'], []).append(entry)
+        self.view.log_message(f"Replaying {sum(map(len, by_phone.values()))} unfinished sends from the outbox")
+        for phone, phone_entries in by_phone.items():
+            asyncio.ensure_future(self._replay_lane(phone, phone_entries))
+
+    async def _replay_lane(self, phone, entries):
+        """Feed replayed entries to the account lane in their original order"""
+        try:
+            for entry in entries:
+                job = self.jobs.create(job_id=entry['id'], phone=phone, destination=entry['destination'], replayed=True)
+                queued_at = time.monotonic()
+                await self.scheduler.submit(
+                    phone,
+                    lambda entry=entry, job=job: self._run_job(
+                        job, phone, entry['destination'], entry['message'], queued_at, entry['id']
+                    ),
+                    wait=True
+                )
+        except Exception as e:
+            self.view.log_message(f"Outbox replay for {phone} stopped: {str(e)}", 'error')
+
+    def _mark_outbox(self, outbox_id, status):
+        if self.outbox:
+            self.outbox.mark(outbox_id, status)
+
+    async def get_job_async(self, job_id):
+        """Return the state of one job as (body, status)"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {'error': 'Job not found', 'job_id': job_id}, 404
+        return job.to_dict(), 200
+
+    async def get_jobs_async(self, ids):
+        """Return the state of several jobs given a comma separated id list"""
+        job_ids = [job_id for job_id in (ids or '').split(',') if job_id]
+        if not job_ids:
+            return {'error': 'Missing parameters', 'required': ['ids']}, 400
+        jobs = [self.jobs.get(job_id) for job_id in job_ids]
+        return {
+            'jobs': [job.to_dict() for job in jobs if job is not None],
+            'missing': [job_id for job_id, job in zip(job_ids, jobs) if job is None]
+        }, 200
+
+    async def send_batch_iter(self, data):
+        """Send a batch of messages concurrently, yielding per-item results as they finish.
+
+        Items for the same phone keep their order on the account lane. Yields
+        {'index', 'status', 'result'} dicts; a malformed batch yields a single
+        dict with an 'error' key and a 'status'.
+        """
+        items = data.get('messages') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            yield {
+                'error': 'Invalid batch',
+                'expected': 'A JSON array of {phone, destination, message} or {"messages": [...]}',
+                'status': 400
+            }
+            return
+        if len(items) > self.settings.batch_max_items:
+            yield {
+                'error': 'Batch too large',
+                'max_items': self.settings.batch_max_items,
+                'status': 413
+            }
+            return
+        
+        self.view.log_message(f"Received send-messages batch with {len(items)} items")
+        
+        async def run_item(index, item):
+            body, status = await self.send_message_async(item, wait_for_lane=True)
+            return {'index': index, 'status': status, 'result': body}
+        
+        # Tasks enqueue on their lanes in creation order, which keeps per-account order
+        tasks = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def send_batch_async(self, data):
+        """Send a batch and return all per-item results at once as (body, status)"""
+        results = []
+        async for item in self.send_batch_iter(data):
+            if 'error' in item:
+                status = item.pop('status')
+                return item, status
+            results.append(item)
+        results.sort(key=lambda item: item['index'])
+        return self._batch_summary(results, results=results), 200
+
+    @staticmethod
+    def _batch_summary(items, **extra):
+        succeeded = sum(1 for item in items if item['status'] == 200)
+        return dict(total=len(items), succeeded=succeeded, failed=len(items) - succeeded, **extra)
+
+    async def send_batch_ndjson(self, data):
+        """Send a batch, yielding one NDJSON line per finished item and a final summary line"""
+        results = []
+        async for item in self.send_batch_iter(data):
+            yield json.dumps(item) + '\n'
+            if 'error' in item:
+                return
+            results.append(item)
+        yield json.dumps(self._batch_summary(results, done=True)) + '\n'
+
+    @staticmethod
+    def is_flag_set(value):
+        """Whether a query string flag such as ?async=1 is enabled"""
+        return (value or '').lower() in ('1', 'true', 'yes')
+
+    def wants_stream(self, args, accept):
+        """Whether a batch request asked for an NDJSON streaming response"""
+        return self.is_flag_set(args.get('stream')) or 'application/x-ndjson' in (accept or '')
+
+    def _handle_send_messages(self):
+        """Handle batch send request"""
+        try:
+            data = request.json
+        except Exception as e:
+            return self._error_response(e)
+        if self.wants_stream(request.args, request.headers.get('Accept')):
+            return self._stream(self.send_batch_ndjson(data), 'application/x-ndjson')
+        return self._dispatch(self.send_batch_async, data)
+
+    def _stream(self, agen, mimetype):
+        """Stream the lines of an async generator running on the event loop to a Flask response"""
+        lines = Queue()
+        done = object()
+        
+        async def pump():
+            try:
+                async for line in agen:
+                    lines.put(line)
+            finally:
+                lines.put(done)
+        
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        
+        def generate():
+            try:
+                while True:
+                    line = lines.get()
+                    if line is done:
+                        break
+                    yield line
+            finally:
+                # Client went away or stream finished; stop the producer either way
+                future.cancel()
+        
+        return Response(generate(), mimetype=mimetype)
+
+    def _pull_stream(self, agen, mimetype, on_close=None):
+        """Stream an async generator to a Flask response, advancing it once per write.
+
+        Unlike _stream nothing is buffered in between, so a slow client slows
+        down the generator itself.
+        """
+        def generate():
+            try:
+                while True:
+                    try:
+                        # The generator yields at least every KEEPALIVE_INTERVAL seconds
+                        yield asyncio.run_coroutine_threadsafe(agen.__anext__(), self.loop).result(
+                            timeout=KEEPALIVE_INTERVAL * 2
+                        )
+                    except StopAsyncIteration:
+                        break
+            except Exception as e:
+                self.view.log_message(f"Stream ended: {type(e).__name__}: {str(e)}", 'warning')
+            finally:
+                if self.loop and self.loop.is_running():
+                    asyncio.run_coroutine_threadsafe(agen.aclose(), self.loop)
+                    if on_close:
+                        self.loop.call_soon_threadsafe(on_close)
+        
+        return Response(generate(), mimetype=mimetype, headers={'Cache-Control': 'no-cache'})
+
+    async def get_messages_async(self, args):
+        """Answer /messages from the in-memory history as (body, status)"""
+        phone = args.get('phone')
+        if not phone:
+            return {'error': 'Missing parameters', 'required': ['phone']}, 400
+        if phone not in self.clients:
+            return {
+                'error': 'Phone number not found',
+                'message': f'Phone number {phone} is not registered',
+                'available_phones': list(self.clients.keys())
+            }, 404
+        chat = args.get('chat')
+        chat_id = None
+        if chat:
+            try:
+                chat_id = int(chat)
+            except ValueError:
+                # Usernames work once they were resolved by a send
+                cache = self.entity_caches.get(phone)
+                hit, input_peer = cache.get(chat) if cache else (False, None)
+                if not hit or input_peer is None:
+                    return {'error': 'Unknown chat', 'message': f'{chat} is not a chat id or a known destination'}, 400
+                chat_id = await self.clients[phone].get_peer_id(input_peer)
+        try:
+            since = self._parse_since(args.get('since'))
+            limit = int(args.get('limit', 100))
+        except ValueError:
+            return {'error': 'Invalid parameters', 'message': 'since must be epoch seconds or ISO 8601, limit an integer'}, 400
+        limit = max(1, min(limit, 1000))
+        messages = self.history.query(phone, chat_id, since, limit)
+        return {'phone': phone, 'chat_id': chat_id, 'count': len(messages), 'messages': messages}, 200
+
+    @staticmethod
+    def _parse_since(value):
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+    async def subscribe_stream_async(self, phones, chats):
+        """Subscribe to inbound messages, returning (subscription, None) or (None, (body, status))"""
+        try:
+            phones = parse_filter(phones)
+            chats = parse_filter(chats, int)
+        except ValueError:
+            return None, ({'error': 'Invalid chat filter', 'message': 'chat must be comma separated chat ids'}, 400)
+        try:
+            return self.feed.subscribe(phones, chats), None
+        except FeedFullError as e:
+            self.view.log_message(str(e), 'warning')
+            return None, ({'error': 'Too many subscribers', 'message': str(e)}, 503)
+
+    def _handle_stream(self):
+        """Handle the /stream Server-Sent Events feed"""
+        try:
+            subscription, error = asyncio.run_coroutine_threadsafe(
+                self.subscribe_stream_async(request.args.get('phone'), request.args.get('chat')), self.loop
+            ).result()
+        except Exception as e:
+            return self._error_response(e)
+        if error:
+            return jsonify(error[0]), error[1]
+        return self._pull_stream(
+            self.feed.sse_lines(subscription), 'text/event-stream',
+            on_close=lambda: self.feed.unsubscribe(subscription)
+        )
+
+    def _validate_send_request(self, data, required=('destination', 'message')):
+        """Validate a send-message payload, returning (error_body, status) or None"""
+        if not isinstance(data, dict):
+            self.view.log_message(f"Invalid send-message payload: {data}", 'error')
+            return {
+                'error': 'Invalid request body',
+                'expected': 'A JSON object with destination, message and phone'
+            }, 400
+        
+        phone = data.get('phone')
+        
+        # Without a phone (or with a pool name) the balancer picks the account
+        if self.settings.balancing_enabled and not (isinstance(phone, str) and phone.startswith('+')):
+            if not all(data.get(key) for key in required):
+                self.view.log_message(f"Missing parameters in request. Received: {data}", 'error')
+                return {
+                    'error': 'Missing parameters',
+                    'required': list(required)
+                }, 400
+            return None
+        
+        # Validate required parameters
+        required = list(required) + ['phone']
+        if not all(data.get(key) for key in required):
+            error_msg = f"Missing parameters in request. Required: {', '.join(required)}. Received: {data}"
+            self.view.log_message(error_msg, 'error')
+            return {
+                'error': 'Missing parameters',
+                'required': required
+            }, 400
+        
+        # Validate phone number format
+        if not phone.startswith('+'):
+            error_msg = f"Invalid phone format: {phone}"
+            self.view.log_message(error_msg, 'error')
+            return {
+                'error': 'Invalid phone number format',
+                'expected': 'Phone number must start with "+" (e.g. +84123456789)'
+            }, 400
+        
+        # Check if phone number exists
+        if phone not in self.clients:
+            available_phones = list(self.clients.keys())
+            error_msg = f"Phone {phone} not found. Available phones: {available_phones}"
+            self.view.log_message(error_msg, 'warning')
+            return {
+                'error': 'Phone number not found',
+                'message': f'Phone number {phone} is not registered',
+                'available_phones': available_phones
+            }, 404
+        
+        return None
+
+    def _check_connection(self, phone):
+        """503 error for an account whose connection is down, None when it can send"""
+        if phone in self.draining:
+            self.view.log_message(f"Rejected request for {phone}: account is being removed", 'warning')
+            return {
+                'error': 'Account unavailable',
+                'message': f'{phone} was removed from the credentials and is finishing its queued sends',
+                'phone': phone,
+                'state': 'removing'
+            }, 503
+        if self.supervisor.is_healthy(phone):
+            return None
+        health = self.supervisor.health[phone]
+        self.view.log_message(f"Rejected request for {phone}: connection is {health.state}", 'warning')
+        return {
+            'error': 'Account unavailable',
+            'message': f'The connection of {phone} is {health.state}',
+            'phone': phone,
+            'state': health.state,
+            'reason': health.reason
+        }, 503
+
+    def _select_phone(self, pool, destination):
+        """Let the balancer choose an account from `pool`, returning (phone, error)"""
+        pool = pool or AccountBalancer.DEFAULT_POOL
+        try:
+            phone = self.balancer.pick(
+                pool, destination, list(self.clients), self._account_load, self._is_account_usable
+            )
+        except PoolNotFoundError as e:
+            self.view.log_message(str(e), 'warning')
+            return None, ({
+                'error': 'Pool not found',
+                'message': str(e),
+                'available_pools': e.available
+            }, 404)
+        if phone is None:
+            self.view.log_message(f"No account available in pool {pool}", 'warning')
+            return None, ({
+                'error': 'No account available',
+                'message': f'Pool {pool} has no connected account'
+            }, 503)
+        return phone, None
+
+    def _account_load(self, phone):
+        """Balancer score: queued sends plus a penalty for a recent FLOOD_WAIT"""
+        load = self.scheduler.depth(phone)
+        limiter = self.limiters.get(phone)
+        if limiter and limiter.recent_flood_wait(self.settings.balancing_flood_window):
+            load += self.settings.balancing_flood_penalty
+        return load
+
+    def _is_account_usable(self, phone):
+        if phone in self.draining or not self.supervisor.is_healthy(phone):
+            return False
+        limiter = self.limiters.get(phone)
+        return not (limiter and limiter.parked_for() > 0)
+
+    async def _resolve_destination(self, phone, destination):
+        """Resolve a destination to an input peer, using the account's entity cache"""
+        cache = self.entity_caches.get(phone)
+        if cache is None:
+            cache = self.entity_caches[phone] = self._new_entity_cache()
+        started = time.monotonic()
+        hit, input_peer = cache.get(destination)
+        if hit:
+            if input_peer is None:
+                self.metric_resolve_seconds.observe(time.monotonic() - started, 'negative_hit')
+                raise ValueError(f'Cached: could not find any entity corresponding to "{destination}"')
+            self.metric_resolve_seconds.observe(time.monotonic() - started, 'hit')
+            return input_peer
+        try:
+            input_peer = await self.clients[phone].get_input_entity(destination)
+        except ValueError:
+            cache.put_missing(destination)
+            raise
         finally:
-            # Always release the global lock when done processing or if an error occurred
-            self.global_request_lock.release()
+            self.metric_resolve_seconds.observe(time.monotonic() - started, 'miss')
+        cache.put(destination, input_peer)
+        return input_peer
+
+    def _new_entity_cache(self):
+        return EntityCache(
+            self.settings.entity_cache_size,
+            self.settings.entity_cache_ttl,
+            self.settings.entity_cache_negative_ttl
+        )
+
+    def _get_limiter(self, phone):
+        limiter = self.limiters.get(phone)
+        if limiter is None:
+            limiter = self.limiters[phone] = AccountRateLimiter(
+                phone,
+                self.settings.rate_limit_per_second,
+                self.settings.rate_limit_burst,
+                self.settings.rate_limit_per_destination_per_minute,
+                self.settings.rate_limit_max_wait
+            )
+        return limiter
+
+    async def _call_with_flood_wait(self, phone, call):
+        """Run a Telegram call, parking the account's lane on FLOOD_WAIT and retrying.
+
+        Raises RateLimitedError when the required wait exceeds rate_limit_max_wait.
+        """
+        limiter = self._get_limiter(phone)
+        while True:
+            await limiter.wait_until_unparked()
+            try:
+                result = await call()
+                self.supervisor.touch(phone)
+                return result
+            except ConnectionError as e:
+                # Reconnect now rather than at the next supervisor check
+                self.supervisor.report_error(phone, e)
+                raise
+            except errors.FloodWaitError as e:
+                limiter.park(e.seconds)
+                self.view.log_message(f"FLOOD_WAIT of {e.seconds}s for {phone}, parking its queue", 'warning')
+
+    def _notify(self, event_type, **fields):
+        """Publish an event to the webhook, if one is configured"""
+        if self.webhooks:
+            self.webhooks.publish({'type': event_type, 'timestamp': datetime.now().isoformat(), **fields})
+
+    async def _send_and_wait(self, phone, destination, message, job_id=None, queued_at=None, outbox_id=None):
+        """Send the message (runs on the account's lane) and return a task waiting for the reply.
+
+        The reply is awaited off the lane, so the account's next message does
+        not wait for this destination to answer.
+        """
+        if queued_at is not None:
+            self.metric_stage_seconds.observe(time.monotonic() - queued_at, 'queue')
+        try:
+            failure, reply = await self._send_once(phone, destination, message)
+        except Exception as e:
+            self._mark_outbox(outbox_id, 'failed')
+            self._notify(
+                'send_result', phone=phone, destination=destination, job_id=job_id,
+                result={'error': str(e), 'type': type(e).__name__}
+            )
+            raise
+        # Marked before the reply arrives: a message that is out must not be replayed
+        self._mark_outbox(outbox_id, 'failed' if failure else 'sent')
+        return asyncio.ensure_future(self._finish_send(phone, destination, failure, reply, job_id))
+
+    async def _finish_send(self, phone, destination, result, reply, job_id=None):
+        """Wait for the reply of a sent message (`reply` is None if nothing was sent), then notify the result"""
+        if reply is not None:
+            result = await reply()
+        self._notify('send_result', phone=phone, destination=destination, job_id=job_id, result=result)
+        return result
+
+    @staticmethod
+    async def _sent_result(submission):
+        """Result of a _send_and_wait lane job; a caller giving up does not cancel the reply wait"""
+        return await asyncio.shield(await submission)
+
+    async def _send_once(self, phone, destination, message):
+        """Resolve the destination and send the message.
+
+        Returns (failure, None) when the destination cannot be resolved, or
+        (None, reply) where `reply()` waits for the answer and builds the result.
+        """
+        destination_id = None # Initialize destination_id
+        try:
+            self.view.log_message(f"Sending message to {destination} using {phone}")
+            # Resolve destination to entity/ID *before* sending
+            try:
+                # Cached lookup in front of get_input_entity (usernames, phone numbers, or IDs)
+                stage_started = time.monotonic()
+                entity = await self._call_with_flood_wait(
+                    phone, lambda: self._resolve_destination(phone, destination)
+                )
+                self.metric_stage_seconds.observe(time.monotonic() - stage_started, 'resolve')
+                # The client resolves InputPeerSelf ('me') to the account's own id
+                destination_id = await self.clients[phone].get_peer_id(entity)
+                self.view.log_message(f"Resolved destination '{destination}' to ID: {destination_id}")
+            except ValueError: # Handle case where destination is not found
+                self.view.log_message(f"Could not find entity for destination: {destination}", 'error')
+                return {
+                    'success': False,
+                    'error': 'Destination not found',
+                    'message': f'Could not resolve Telegram entity for {destination}',
+                    'phone': phone,
+                    'timestamp': datetime.now().isoformat()
+                }, None
+            except Exception as e: # Catch other potential errors during entity resolution
+                self.view.log_message(f"Error resolving entity {destination}: {str(e)}", 'error')
+                raise # Re-raise to be caught by the outer handler which returns 500
+
+            limiter = self._get_limiter(phone)
+            
+            async def send():
+                # Wait for the account and destination rate limits
+                await limiter.acquire(destination_id)
+                # Register for the reply before sending so a fast reply cannot be missed
+                reply_future = self.replies.expect(phone, destination_id)
+                # Send message using the resolved entity
+                try:
+                    sent = await self.clients[phone].send_message(entity, message)
+                except Exception:
+                    self.replies.discard(phone, destination_id, reply_future)
+                    raise
+                self.history.record(
+                    phone, destination_id, 'out', getattr(sent, 'id', None), message,
+                    date=getattr(sent, 'date', None)
+                )
+                return reply_future
+            
+            stage_started = time.monotonic()
+            reply_future = await self._call_with_flood_wait(phone, send)
+            self.metric_stage_seconds.observe(time.monotonic() - stage_started, 'send')
+            sent_time = datetime.now()
+            self.view.log_message(f"Message sent to {destination} (ID: {destination_id}) at {sent_time}")
+        except Exception as e:
+            self.view.log_message(f"Error in send_and_wait: {str(e)}", 'error')
+            raise
+        
+        async def reply():
+            # Return as soon as the destination replies, or give up after the reply timeout
+            stage_started = time.monotonic()
+            final_response_data = await self.replies.wait(
+                phone, destination_id, reply_future, self.settings.reply_timeout
+            )
+            self.metric_stage_seconds.observe(time.monotonic() - stage_started, 'reply_wait')
+            response_time = (datetime.now() - sent_time).total_seconds() # Use total_seconds for precision
+            if final_response_data is None:
+                self.view.log_message(
+                    f"No response received from {destination} (ID: {destination_id}) after {self.settings.reply_timeout} seconds",
+                    'warning'
+                )
+
+            return {
+                'success': True, # Message sending itself was successful (unless get_entity failed)
+                'message': f'Message sent to {destination}',
+                'phone': phone,
+                'timestamp': datetime.now().isoformat(),
+                'sent_at': sent_time.isoformat(),
+                'response_time': response_time,
+                'response': final_response_data,
+            }
+        return None, reply
+
+    def _init_metrics(self):
+        """Create the metrics served on /metrics"""
+        self.metrics = MetricsRegistry()
+        self.metric_requests = self.metrics.counter(
+            'telegram_api_send_requests_total', 'Send requests by HTTP status', ('status',)
+        )
+        self.metric_request_seconds = self.metrics.histogram(
+            'telegram_api_send_request_seconds', 'Total time to answer a send request'
+        )
+        self.metric_stage_seconds = self.metrics.histogram(
+            'telegram_api_send_stage_seconds',
+            'Time spent per send stage (validate, queue, resolve, send, reply_wait)',
+            ('stage',)
+        )
+        self.metric_resolve_seconds = self.metrics.histogram(
+            'telegram_api_entity_resolve_seconds', 'Destination resolution time by cache result', ('cache',)
+        )
+        self.metric_loop_lag = self.metrics.histogram(
+            'telegram_api_event_loop_lag_seconds', 'Delay of the event loop waking up a timer'
+        )
+        self.metrics.collected(
+            'telegram_api_event_loop_lag_last_seconds', 'Most recent event loop lag sample', (),
+            lambda: [((), self.loop_lag)]
+        )
+        self.metrics.collected(
+            'telegram_account_queue_depth', 'Send requests waiting on the account lane', ('phone',),
+            lambda: [((phone,), lane.queue.qsize()) for phone, lane in self._lanes()]
+        )
+        self.metrics.collected(
+            'telegram_account_in_flight', 'Send requests being processed for the account', ('phone',),
+            lambda: [((phone,), lane.in_flight) for phone, lane in self._lanes()]
+        )
+        self.metrics.collected(
+            'telegram_account_flood_waits_total', 'FLOOD_WAIT errors received by the account', ('phone',),
+            lambda: [((phone,), limiter.flood_waits) for phone, limiter in self.limiters.items()],
+            kind='counter'
+        )
+        self.metrics.collected(
+            'telegram_account_connected', 'Whether the account connection is up (1) or not (0)', ('phone',),
+            lambda: [((phone,), int(self.supervisor.is_healthy(phone))) for phone in list(self.clients)]
+        )
+        self.metrics.collected(
+            'telegram_account_parked_seconds', 'Remaining FLOOD_WAIT park time of the account', ('phone',),
+            lambda: [((phone,), limiter.parked_for()) for phone, limiter in self.limiters.items()]
+        )
+
+    def _lanes(self):
+        return list(self.scheduler.lanes.items()) if self.scheduler else []
+
+    async def _monitor_loop_lag(self, interval=0.5):
+        """Measure how late the event loop wakes up a timer"""
+        while True:
+            started = self.loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, self.loop.time() - started - interval)
+            self.metric_loop_lag.observe(self.loop_lag)
+
+    async def metrics_async(self):
+        """Render all metrics in the text exposition format"""
+        return self.metrics.render()
+
+    def _handle_metrics(self):
+        """Handle metrics scrape"""
+        try:
+            text = asyncio.run_coroutine_threadsafe(self.metrics_async(), self.loop).result()
+        except Exception as e:
+            return self._error_response(e)
+        return Response(text, content_type=MetricsRegistry.CONTENT_TYPE)
+
+    async def get_stats_async(self):
+        """Answer /stats as (body, status); the counters are read on the event loop that updates them"""
+        return self.get_stats(), 200
+
+    def get_stats(self):
+        """Return runtime counters of the controller (call from the event loop)"""
+        return {
+            'entity_cache': {phone: cache.stats() for phone, cache in self.entity_caches.items()},
+            'rate_limit': {phone: limiter.stats() for phone, limiter in self.limiters.items()},
+            'jobs': self.jobs.stats(),
+            'webhook': self.webhooks.stats() if self.webhooks else None,
+            'outbox': self.outbox.stats() if self.outbox else None,
+            'capture': self.capture.stats() if self.capture else None,
+            'connections': self.supervisor.stats(),
+            'sessions': self.sessions.stats() if self.sessions else None,
+            'stream': self.feed.stats(),
+            'history': self.history.stats(),
+            'media_cache': {phone: cache.stats() for phone, cache in self.media_caches.items()}
+        }
 
     def is_running(self):
         """Return current API status"""
@@ -0,0 +1,183 @@
+import asyncio
+import json
+from src.utils.metrics import MetricsRegistry
+from src.utils.message_feed import KEEPALIVE_INTERVAL
+from src.utils.media_upload import CHUNK_SIZE, FileTooLargeError, part_chunks, spool_async
+
+
+class AsyncAPIServer:
+    """Serve the API with aiohttp directly on the controller's event loop.
+
+    Requests are handled as coroutines on the loop the Telegram clients run on,
+    so a waiting request costs a task instead of an OS thread. The JSON contract
+    is the same as the Flask server's.
+    """
+    def __init__(self, controller, host, port):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def start(self):
+        """Start listening; must run on the controller's event loop"""
+        try:
+            from aiohttp import web
+        except ImportError:
+            raise RuntimeError("The asyncio server mode requires aiohttp (pip install aiohttp)")
+
+        app = web.Application()
+        app.router.add_post('/send-message', self._send_message)
+        app.router.add_post('/send-messages', self._send_messages)
+        app.router.add_post('/send-file', self._send_file)
+        app.router.add_get('/jobs/{job_id}', self._get_job)
+        app.router.add_get('/jobs', self._get_jobs)
+        app.router.add_get('/messages', self._messages)
+        app.router.add_get('/stream', self._stream)
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_post('/reload', self._reload)
+        app.router.add_get('/stats', self._stats)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+
+    async def stop(self):
+        """Close the listening socket and all open connections"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    @staticmethod
+    def _json(body, status=200):
+        from aiohttp import web
+        return web.json_response(body, status=status, dumps=lambda obj: json.dumps(obj, sort_keys=True))
+
+    def _error(self, e):
+        self.controller.view.log_message(f"Error processing request: {str(e)}", 'error')
+        return self._json({'error': str(e), 'type': type(e).__name__}, 500)
+
+    async def _send_message(self, request):
+        try:
+            data = await request.json()
+        except Exception as e:
+            return self._error(e)
+        run_async = self.controller.is_flag_set(request.query.get('async'))
+        body, status = await self.controller.send_message_async(data, run_async=run_async)
+        return self._json(body, status)
+
+    async def _send_messages(self, request):
+        from aiohttp import web
+        try:
+            data = await request.json()
+        except Exception as e:
+            return self._error(e)
+        if not self.controller.wants_stream(request.query, request.headers.get('Accept')):
+            body, status = await self.controller.send_batch_async(data)
+            return self._json(body, status)
+        
+        # Write each item as soon as it finishes
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        async for line in self.controller.send_batch_ndjson(data):
+            await response.write(line.encode('utf-8'))
+        await response.write_eof()
+        return response
+
+    async def _send_file(self, request):
+        """Multipart form (file part plus fields) or raw body with the fields in the query string"""
+        max_size = self.controller.settings.media_max_size
+        fields = dict(request.query)
+        fields.setdefault('content_hash', request.headers.get('X-Content-SHA256'))
+        source, size, digest = None, 0, None
+        try:
+            if request.content_type.startswith('multipart/'):
+                reader = await request.multipart()
+                async for part in reader:
+                    if part.name == 'file' and source is None:
+                        source, size, digest = await spool_async(part_chunks(part), max_size)
+                        fields.setdefault('file_name', part.filename)
+                        fields.setdefault('mime_type', part.headers.get('Content-Type'))
+                    else:
+                        fields[part.name] = await part.text()
+            elif request.content_type == 'application/x-www-form-urlencoded':
+                # Fields only: sends content uploaded before (content_hash)
+                fields.update(await request.post())
+            else:
+                source, size, digest = await spool_async(request.content.iter_chunked(CHUNK_SIZE), max_size)
+                fields.setdefault('mime_type', request.content_type)
+        except FileTooLargeError as e:
+            if source:
+                source.close()
+            return self._json({'error': 'File too large', 'message': str(e)}, 413)
+        except Exception as e:
+            if source:
+                source.close()
+            return self._error(e)
+        run_async = self.controller.is_flag_set(request.query.get('async'))
+        body, status = await self.controller.send_file_async(fields, source, size, digest, run_async)
+        return self._json(body, status)
+
+    async def _get_job(self, request):
+        body, status = await self.controller.get_job_async(request.match_info['job_id'])
+        return self._json(body, status)
+
+    async def _get_jobs(self, request):
+        body, status = await self.controller.get_jobs_async(request.query.get('ids'))
+        return self._json(body, status)
+
+    async def _messages(self, request):
+        body, status = await self.controller.get_messages_async(request.query)
+        return self._json(body, status)
+
+    async def _stream(self, request):
+        """Inbound messages as Server-Sent Events, or as JSON frames over a WebSocket upgrade"""
+        from aiohttp import web
+        feed = self.controller.feed
+        subscription, error = await self.controller.subscribe_stream_async(
+            request.query.get('phone'), request.query.get('chat')
+        )
+        if error:
+            return self._json(*error)
+        
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            ws = web.WebSocketResponse(heartbeat=KEEPALIVE_INTERVAL)
+            await ws.prepare(request)
+            try:
+                while not ws.closed:
+                    try:
+                        event = await subscription.get(KEEPALIVE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        continue
+                    if event is None:
+                        await ws.close(code=1008, message=subscription.closed_reason.encode('utf-8'))
+                        break
+                    await ws.send_json(event)
+            except ConnectionResetError:
+                pass
+            finally:
+                feed.unsubscribe(subscription)
+            return ws
+        
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        try:
+            async for line in feed.sse_lines(subscription):
+                await response.write(line.encode('utf-8'))
+        except ConnectionResetError:
+            pass
+        finally:
+            feed.unsubscribe(subscription)
+        return response
+
+    async def _metrics(self, request):
+        from aiohttp import web
+        text = await self.controller.metrics_async()
+        return web.Response(body=text.encode('utf-8'), headers={'Content-Type': MetricsRegistry.CONTENT_TYPE})
+
+    async def _reload(self, request):
+        body, status = await self.controller.reload_credentials_async()
+        return self._json(body, status)
+
+    async def _stats(self, request):
+        return self._json(self.controller.get_stats())
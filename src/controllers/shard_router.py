@@ -0,0 +1,495 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+from src.utils.media_upload import FileTooLargeError, part_chunks, spool_async
+from src.utils.message_feed import KEEPALIVE_INTERVAL, parse_filter
+
+SHARD_DIR = os.path.join('config', 'shards')
+
+
+def shard_file(path, index):
+    """Per-worker variant of a file setting: config/cache.json -> config/cache.shard-0.json"""
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition('.')
+    return os.path.join(directory, f'{stem}.shard-{index}{dot}{extensions}')
+
+
+class Shard:
+    """One worker process serving a subset of the accounts"""
+    def __init__(self, index, credentials, port):
+        self.index = index
+        self.credentials = credentials
+        self.phones = [cred['phone'] for cred in credentials]
+        self.port = port
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.port}{path}'
+
+
+class ShardRouter:
+    """Split the accounts across worker processes behind one HTTP front end.
+
+    Every worker runs the headless API with its own event loop on
+    127.0.0.1:<port + 1 + index>. The router forwards requests to the worker
+    owning the phone over keep-alive connections and restarts a worker that
+    exits, without touching the others. Job ids are prefixed with the shard
+    index ("<index>-<id>") so job lookups reach the right worker, and the
+    /stream feeds of the workers are merged into one.
+    """
+    RESTART_BACKOFF_MAX = 30  # Seconds between restarts of a worker that keeps crashing
+    STABLE_AFTER = 60  # Seconds a worker must run before its restart backoff is reset
+
+    def __init__(self, settings, credentials, workers, worker_args, log):
+        self.settings = settings
+        self.worker_args = worker_args  # Extra headless.py arguments for every worker
+        self.log = log
+        count = max(1, min(workers, len(credentials)))
+        self.shards = [
+            Shard(index, credentials[index::count], settings.port + 1 + index)
+            for index in range(count)
+        ]
+        self.owner = {phone: shard for shard in self.shards for phone in shard.phones}
+        self.session = None
+        self.runner = None
+        self.supervisors = []
+        self.stopping = False
+
+    def _write_shard_config(self, shard):
+        """Write the credentials and settings files a worker is started with"""
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        credentials_file = os.path.join(SHARD_DIR, f'credentials-{shard.index}.json')
+        with open(credentials_file, 'w') as f:
+            json.dump(shard.credentials, f, indent=4)
+        # Workers write these on stop, each with its own accounts only
+        settings = dict(
+            self.settings.to_dict(),
+            credentials_file=credentials_file,
+            host='127.0.0.1',
+            port=shard.port,
+            server_mode='asyncio',
+            entity_cache_file=shard_file(self.settings.entity_cache_file, shard.index),
+            media_cache_file=shard_file(self.settings.media_cache_file, shard.index),
+            # Concurrent appends from several processes would corrupt one gzip file
+            capture_file=shard_file(self.settings.capture_file, shard.index) if self.settings.capture_file else None
+        )
+        settings_file = os.path.join(SHARD_DIR, f'settings-{shard.index}.json')
+        with open(settings_file, 'w') as f:
+            json.dump(settings, f, indent=4)
+        return settings_file, credentials_file
+
+    async def _spawn(self, shard):
+        settings_file, credentials_file = self._write_shard_config(shard)
+        headless = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'headless.py')
+        # Explicit arguments win over TELEGRAM_* variables inherited from the router
+        shard.process = await asyncio.create_subprocess_exec(
+            sys.executable, headless,
+            '--settings', settings_file,
+            '--credentials', credentials_file,
+            '--host', '127.0.0.1',
+            '--port', str(shard.port),
+            '--server-mode', 'asyncio',
+            '--workers', '0',
+            *self.worker_args(shard.index)
+        )
+        shard.started_at = time.monotonic()
+        self.log(f"Shard {shard.index} started (pid {shard.process.pid}) with {len(shard.phones)} accounts on port {shard.port}")
+
+    async def _supervise(self, shard):
+        """Keep a worker running, restarting it with backoff when it exits"""
+        backoff = 1
+        while not self.stopping:
+            await self._spawn(shard)
+            code = await shard.process.wait()
+            if self.stopping:
+                break
+            if time.monotonic() - shard.started_at > self.STABLE_AFTER:
+                backoff = 1
+            self.log(f"Shard {shard.index} exited with code {code}, restarting in {backoff}s", 'error')
+            shard.restarts += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.RESTART_BACKOFF_MAX)
+
+    async def start(self):
+        """Start the workers and the front end on the running loop"""
+        try:
+            import aiohttp
+            from aiohttp import web
+        except ImportError:
+            raise RuntimeError("Sharding requires aiohttp (pip install aiohttp)")
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.settings.request_timeout + 10)
+        )
+        self.supervisors = [asyncio.ensure_future(self._supervise(shard)) for shard in self.shards]
+
+        app = web.Application()
+        app.router.add_post('/send-message', self._send_message)
+        app.router.add_post('/send-messages', self._send_messages)
+        app.router.add_post('/send-file', self._send_file)
+        app.router.add_get('/jobs/{job_id}', self._get_job)
+        app.router.add_get('/jobs', self._get_jobs)
+        app.router.add_get('/messages', self._messages)
+        app.router.add_get('/stream', self._stream)
+        app.router.add_get('/stats', self._stats)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.settings.host, self.settings.port)
+        await site.start()
+        self.log(f"Shard router listening on {self.settings.host}:{self.settings.port} with {len(self.shards)} workers")
+
+    async def stop(self, timeout=30):
+        """Stop accepting requests and shut the workers down gracefully"""
+        self.stopping = True
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+        for supervisor in self.supervisors:
+            supervisor.cancel()
+        await asyncio.gather(*self.supervisors, return_exceptions=True)
+        for shard in self.shards:
+            if shard.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            try:
+                await asyncio.wait_for(shard.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.log(f"Shard {shard.index} did not stop gracefully, killing it", 'warning')
+                shard.process.kill()
+                await shard.process.wait()
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def _shard_for(self, data):
+        """Worker owning the request's phone; other requests (pools, no phone) are spread by destination"""
+        shard = self.owner.get(data.get('phone')) if isinstance(data, dict) else None
+        if shard is None:
+            destination = str(data.get('destination', '')) if isinstance(data, dict) else ''
+            shard = self.shards[zlib.crc32(destination.encode('utf-8')) % len(self.shards)]
+        return shard
+
+    async def _forward(self, shard, method, path, params=None, body=None, **options):
+        """Call a worker, returning (body, status); an unreachable worker answers 503, a slow one 504.
+
+        `options` are passed to the aiohttp request (e.g. a form as `data`).
+        """
+        import aiohttp
+        if not shard.is_alive():
+            return self._unavailable(shard)
+        try:
+            async with self.session.request(method, shard.url(path), params=params, json=body, **options) as response:
+                return await response.json(), response.status
+        except asyncio.TimeoutError:
+            # The worker has the request and may still complete it, so it is not reported as retryable
+            self.log(f"Timed out forwarding {path} to shard {shard.index}", 'error')
+            return {
+                'error': 'Request timed out',
+                'message': 'The worker did not answer in time; the request may still complete',
+                'shard': shard.index
+            }, 504
+        except (aiohttp.ClientError, ValueError) as e:
+            self.log(f"Error forwarding {path} to shard {shard.index}: {type(e).__name__}: {str(e)}", 'error')
+            return self._unavailable(shard)
+
+    @staticmethod
+    def _unavailable(shard):
+        return {
+            'error': 'Shard unavailable',
+            'message': 'The worker serving this account is restarting, retry shortly',
+            'shard': shard.index,
+            'retry_after': 1
+        }, 503
+
+    @staticmethod
+    def _prefix_job(shard, body):
+        if isinstance(body, dict) and body.get('job_id'):
+            body['job_id'] = f"{shard.index}-{body['job_id']}"
+        return body
+
+    def _split_job_id(self, job_id):
+        index, _, worker_id = job_id.partition('-')
+        if not index.isdigit() or int(index) >= len(self.shards) or not worker_id:
+            return None, job_id
+        return self.shards[int(index)], worker_id
+
+    @staticmethod
+    def _json(body, status=200):
+        from aiohttp import web
+        return web.json_response(body, status=status, dumps=lambda obj: json.dumps(obj, sort_keys=True))
+
+    async def _read_json(self, request):
+        try:
+            return await request.json(), None
+        except Exception as e:
+            return None, self._json({'error': str(e), 'type': type(e).__name__}, 500)
+
+    async def _send_message(self, request):
+        data, error = await self._read_json(request)
+        if error:
+            return error
+        shard = self._shard_for(data)
+        body, status = await self._forward(shard, 'POST', '/send-message', dict(request.query), data)
+        return self._json(self._prefix_job(shard, body), status)
+
+    async def _send_file(self, request):
+        """Forward a file send to the worker owning its phone.
+
+        A raw body is streamed through, routed by the query string. A form is
+        read first to find its phone (the file part into a temporary file, like
+        the worker does) and sent on as a new form.
+        """
+        import aiohttp
+        fields = {}
+        source = None
+        headers = {}
+        if request.headers.get('X-Content-SHA256'):
+            headers['X-Content-SHA256'] = request.headers['X-Content-SHA256']
+        try:
+            if request.content_type.startswith('multipart/'):
+                form = aiohttp.FormData()
+                reader = await request.multipart()
+                async for part in reader:
+                    if part.name == 'file' and source is None:
+                        source, _, _ = await spool_async(part_chunks(part), self.settings.media_max_size)
+                        form.add_field(
+                            'file', source, filename=part.filename or 'file',
+                            content_type=part.headers.get('Content-Type') or 'application/octet-stream'
+                        )
+                    else:
+                        fields[part.name] = await part.text()
+                for name, value in fields.items():
+                    form.add_field(name, value)
+                data = form
+            elif request.content_type == 'application/x-www-form-urlencoded':
+                fields.update(await request.post())
+                data = aiohttp.FormData(fields)
+            else:
+                data = request.content
+                headers['Content-Type'] = request.content_type
+        except FileTooLargeError as e:
+            if source:
+                source.close()
+            return self._json({'error': 'File too large', 'message': str(e)}, 413)
+        except Exception as e:
+            if source:
+                source.close()
+            return self._json({'error': str(e), 'type': type(e).__name__}, 500)
+        try:
+            shard = self._shard_for(dict(request.query, **fields))
+            # Uploads may take longer than a message send
+            body, status = await self._forward(
+                shard, 'POST', '/send-file', dict(request.query), data=data, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=None)
+            )
+        finally:
+            if source:
+                source.close()
+        return self._json(self._prefix_job(shard, body), status)
+
+    async def _send_messages(self, request):
+        """Split a batch by worker, send the parts concurrently and merge the results"""
+        import aiohttp
+        data, error = await self._read_json(request)
+        if error:
+            return error
+        items = data.get('messages') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return self._json({
+                'error': 'Invalid batch',
+                'expected': 'A JSON array of {phone, destination, message} or {"messages": [...]}'
+            }, 400)
+        parts = {}
+        for index, item in enumerate(items):
+            parts.setdefault(self._shard_for(item), []).append(index)
+
+        async def send_part(shard, indexes):
+            # Items wait for their lane (and rate limits) on the worker, so a batch has no time limit
+            body, status = await self._forward(
+                shard, 'POST', '/send-messages', None, [items[i] for i in indexes],
+                timeout=aiohttp.ClientTimeout(total=None)
+            )
+            if status != 200:
+                return [{'index': i, 'status': status, 'result': body} for i in indexes]
+            # Map the worker's item indexes back to positions in the original batch
+            return [dict(result, index=indexes[result['index']]) for result in body['results']]
+
+        merged = await asyncio.gather(*(send_part(shard, indexes) for shard, indexes in parts.items()))
+        results = sorted((result for part in merged for result in part), key=lambda result: result['index'])
+        succeeded = sum(1 for result in results if result['status'] == 200)
+        return self._json({
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'results': results
+        })
+
+    async def _get_job(self, request):
+        job_id = request.match_info['job_id']
+        shard, worker_id = self._split_job_id(job_id)
+        if shard is None:
+            return self._json({'error': 'Job not found', 'job_id': job_id}, 404)
+        body, status = await self._forward(shard, 'GET', f'/jobs/{worker_id}')
+        return self._json(self._prefix_job(shard, body), status)
+
+    async def _get_jobs(self, request):
+        job_ids = [job_id for job_id in request.query.get('ids', '').split(',') if job_id]
+        if not job_ids:
+            return self._json({'error': 'Missing parameters', 'required': ['ids']}, 400)
+        by_shard, missing = {}, []
+        for job_id in job_ids:
+            shard, worker_id = self._split_job_id(job_id)
+            if shard is None:
+                missing.append(job_id)
+            else:
+                by_shard.setdefault(shard, []).append(worker_id)
+
+        async def lookup(shard, worker_ids):
+            body, status = await self._forward(shard, 'GET', '/jobs', {'ids': ','.join(worker_ids)})
+            if status != 200:
+                return [], [f'{shard.index}-{worker_id}' for worker_id in worker_ids]
+            jobs = [self._prefix_job(shard, job) for job in body['jobs']]
+            return jobs, [f'{shard.index}-{worker_id}' for worker_id in body['missing']]
+
+        jobs = []
+        for found, lost in await asyncio.gather(*(lookup(shard, ids) for shard, ids in by_shard.items())):
+            jobs.extend(found)
+            missing.extend(lost)
+        return self._json({'jobs': jobs, 'missing': missing})
+
+    async def _messages(self, request):
+        phone = request.query.get('phone')
+        if not phone:
+            return self._json({'error': 'Missing parameters', 'required': ['phone']}, 400)
+        shard = self.owner.get(phone)
+        if shard is None:
+            return self._json({
+                'error': 'Phone number not found',
+                'message': f'Phone number {phone} is not registered',
+                'available_phones': list(self.owner)
+            }, 404)
+        body, status = await self._forward(shard, 'GET', '/messages', dict(request.query))
+        return self._json(body, status)
+
+    async def _stream(self, request):
+        """Merge the /stream feeds of the workers owning the requested phones.
+
+        The merged feed is served as Server-Sent Events or over a WebSocket,
+        like a single worker does. It ends as soon as one worker feed ends
+        (slow consumer, worker restart), so clients reconnect as they would
+        to a single worker.
+        """
+        import aiohttp
+        from aiohttp import web
+        phones = parse_filter(request.query.get('phone'))
+        shards = [shard for shard in self.shards if not phones or phones & set(shard.phones)]
+        if not shards:
+            return self._json({
+                'error': 'Phone number not found',
+                'message': f"No worker serves {', '.join(sorted(phones))}",
+                'available_phones': list(self.owner)
+            }, 404)
+        
+        upstreams = []
+        readers = []
+        events = asyncio.Queue(maxsize=self.settings.stream_buffer_size)
+        try:
+            for shard in shards:
+                if not shard.is_alive():
+                    return self._json(*self._unavailable(shard))
+                try:
+                    upstream = await self.session.get(
+                        shard.url('/stream'), params=dict(request.query),
+                        timeout=aiohttp.ClientTimeout(total=None)
+                    )
+                except aiohttp.ClientError as e:
+                    self.log(f"Error opening the stream of shard {shard.index}: {type(e).__name__}: {str(e)}", 'error')
+                    return self._json(*self._unavailable(shard))
+                upstreams.append(upstream)
+                if upstream.status != 200:
+                    return self._json(await upstream.json(), upstream.status)
+            readers = [asyncio.ensure_future(self._read_events(upstream, events)) for upstream in upstreams]
+            
+            if request.headers.get('Upgrade', '').lower() == 'websocket':
+                ws = web.WebSocketResponse(heartbeat=KEEPALIVE_INTERVAL)
+                await ws.prepare(request)
+                try:
+                    while not ws.closed:
+                        try:
+                            event, data = await asyncio.wait_for(events.get(), KEEPALIVE_INTERVAL)
+                        except asyncio.TimeoutError:
+                            continue
+                        if event == 'closed':
+                            await ws.close(code=1008, message=json.loads(data)['reason'].encode('utf-8'))
+                            break
+                        await ws.send_str(data)
+                except ConnectionResetError:
+                    pass
+                return ws
+            
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+            await response.prepare(request)
+            try:
+                await response.write(b': connected\n\n')
+                while True:
+                    try:
+                        event, data = await asyncio.wait_for(events.get(), KEEPALIVE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await response.write(b': keepalive\n\n')
+                        continue
+                    await response.write(f"event: {event}\ndata: {data}\n\n".encode('utf-8'))
+                    if event == 'closed':
+                        break
+            except ConnectionResetError:
+                pass
+            return response
+        finally:
+            for reader in readers:
+                reader.cancel()
+            for upstream in upstreams:
+                upstream.release()
+
+    @staticmethod
+    async def _read_events(upstream, events):
+        """Put the (event, data) pairs of a worker's SSE feed on `events`, ending with a 'closed' event"""
+        import aiohttp
+        event, data = None, None
+        try:
+            async for line in upstream.content:
+                line = line.decode('utf-8').rstrip('\r\n')
+                if line.startswith('event: '):
+                    event = line[len('event: '):]
+                elif line.startswith('data: '):
+                    data = line[len('data: '):]
+                elif not line and event:
+                    await events.put((event, data))
+                    if event == 'closed':
+                        return
+                    event, data = None, None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        await events.put(('closed', json.dumps({'reason': 'worker stopped'})))
+
+    async def _stats(self, request):
+        async def shard_stats(shard):
+            body, status = await self._forward(shard, 'GET', '/stats')
+            return {
+                'shard': shard.index,
+                'pid': shard.process.pid if shard.is_alive() else None,
+                'port': shard.port,
+                'accounts': len(shard.phones),
+                'restarts': shard.restarts,
+                'stats': body if status == 200 else None
+            }
+        return self._json({'shards': await asyncio.gather(*(shard_stats(shard) for shard in self.shards))})
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+
+# Add src directory to Python path
+src_dir = str(Path(__file__).parent.parent)
+if src_dir not in sys.path:
+    sys.path.append(src_dir)
+
+from src.models.api_settings import APISettings, SETTINGS_FILE
+from src.views.headless_view import HeadlessView, CODE_SOURCES
+from src.controllers.api_controller import APIController
+from src.controllers.shard_router import ShardRouter
+from src.utils.logger_config import shutdown_logging
+
+# Every option can also be given through the environment
+ENV_PREFIX = 'TELEGRAM_'
+
+
+def _env(name, default=None):
+    return os.environ.get(ENV_PREFIX + name, default)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Telegram Client API without the UI")
+    parser.add_argument('--settings', default=_env('SETTINGS', SETTINGS_FILE),
+                        help="API settings file (env TELEGRAM_SETTINGS)")
+    parser.add_argument('--credentials', default=_env('CREDENTIALS'),
+                        help="Credentials file, overrides credentials_file (env TELEGRAM_CREDENTIALS)")
+    parser.add_argument('--host', default=_env('HOST'), help="Overrides host (env TELEGRAM_HOST)")
+    parser.add_argument('--port', type=int, default=_env('PORT'), help="Overrides port (env TELEGRAM_PORT)")
+    parser.add_argument('--server-mode', choices=('flask', 'asyncio'), default=_env('SERVER_MODE'),
+                        help="Overrides server_mode (env TELEGRAM_SERVER_MODE)")
+    parser.add_argument('--login-code-source', choices=CODE_SOURCES, default=_env('LOGIN_CODE_SOURCE', 'stdin'),
+                        help="Where login codes come from (env TELEGRAM_LOGIN_CODE_SOURCE)")
+    parser.add_argument('--login-code-dir', default=_env('LOGIN_CODE_DIR', os.path.join('config', 'login_codes')),
+                        help="Directory polled for <phone>.code files (env TELEGRAM_LOGIN_CODE_DIR)")
+    parser.add_argument('--login-code-port', type=int, default=_env('LOGIN_CODE_PORT', 5099),
+                        help="Port of the local /login-code endpoint (env TELEGRAM_LOGIN_CODE_PORT)")
+    parser.add_argument('--login-code-timeout', type=float, default=_env('LOGIN_CODE_TIMEOUT', 300),
+                        help="Seconds to wait for each login code (env TELEGRAM_LOGIN_CODE_TIMEOUT)")
+    parser.add_argument('--workers', type=int, default=_env('WORKERS', 0),
+                        help="Split the accounts across this many worker processes behind a router "
+                             "(env TELEGRAM_WORKERS, 0 runs everything in this process)")
+    return parser.parse_args(argv)
+
+
+def load_settings(args):
+    """Settings file values with the command line / environment overrides applied"""
+    settings = APISettings.load(args.settings)
+    overrides = {
+        'credentials_file': args.credentials,
+        'host': args.host,
+        'port': args.port,
+        'server_mode': args.server_mode
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            setattr(settings, key, value)
+    return settings
+
+
+def run_sharded(args, settings, view, stopping):
+    """Run the shard router until `stopping` is set"""
+    with open(settings.credentials_file, 'r') as f:
+        credentials = json.load(f)
+
+    def worker_args(index):
+        # Each worker gets its own login code endpoint port
+        return [
+            '--login-code-source', args.login_code_source,
+            '--login-code-dir', args.login_code_dir,
+            '--login-code-port', str(args.login_code_port + 1 + index),
+            '--login-code-timeout', str(args.login_code_timeout)
+        ]
+
+    router = ShardRouter(settings, credentials, args.workers, worker_args, view.log_message)
+
+    async def serve():
+        await router.start()
+        try:
+            while not stopping.is_set():
+                await asyncio.sleep(0.2)
+        finally:
+            await router.stop()
+
+    asyncio.run(serve())
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = load_settings(args)
+    view = HeadlessView(
+        code_source=args.login_code_source,
+        code_dir=args.login_code_dir,
+        code_port=args.login_code_port,
+        code_timeout=args.login_code_timeout
+    )
+
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stopping.set())
+
+    if args.workers > 0:
+        try:
+            run_sharded(args, settings, view, stopping)
+        finally:
+            shutdown_logging()
+        return
+
+    controller = APIController(view, settings)
+
+    try:
+        controller.start_api()
+        # Wait in short steps so signals are handled promptly on every platform
+        while not stopping.wait(1):
+            pass
+    finally:
+        if controller.is_running():
+            controller.stop_api()
+        # Write out queued log records before exiting
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,14 @@ if src_dir not in sys.path:
     sys.path.append(src_dir)
 
 from src.views.main_window import MainWindow
+from src.utils.logger_config import shutdown_logging
 
 def main():
     root = tk.Tk()
     app = MainWindow(root)
     root.mainloop()
+    # Write out queued log records before exiting
+    shutdown_logging()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import json
+import os
+
+SETTINGS_FILE = os.path.join('config', 'api_settings.json')
+
+# Default values for every tunable of the API controller
+DEFAULTS = {
+    'server_mode': 'flask',  # 'flask' (thread per request) or 'asyncio' (aiohttp on the client loop)
+    'host': '0.0.0.0',
+    'port': 5000,
+    'credentials_file': os.path.join('config', 'telegram_credentials.json'),  # Accounts served by start_api
+    'credentials_watch_interval': 5,  # Seconds between checks of credentials_file for changes (0 disables)
+    'startup_concurrency': 10,  # Accounts connecting at the same time in start_api
+    'session_store': 'files',  # 'files' (a .session file per account) or 'sqlite' (all in session_store_file)
+    'session_store_file': os.path.join('config', 'sessions.db'),
+    'session_flush_interval': 1.0,  # Seconds between batched session writes with the 'sqlite' store
+    'queue_depth': 100,  # Max pending send requests per account lane
+    'reply_timeout': 10,  # Seconds to wait for the destination to reply
+    'request_timeout': 40,  # Seconds an HTTP request waits for its send to finish
+    'batch_max_items': 1000,  # Max messages accepted by one /send-messages call
+    'job_store_size': 10000,  # Finished ?async=1 jobs kept in memory for /jobs lookups
+    'rate_limit_per_second': 1.0,  # Sends per second per account (0 disables)
+    'rate_limit_burst': 5,  # Sends allowed back to back before the per-second rate applies
+    'rate_limit_per_destination_per_minute': 20,  # Sends per minute to one destination (0 disables)
+    'rate_limit_max_wait': 30,  # Longer rate limit or FLOOD_WAIT waits are rejected with 429
+    'supervisor_interval': 5,  # Seconds between connection checks of every account
+    'keepalive_idle': 60,  # Ping connections that have been idle for this many seconds
+    'keepalive_timeout': 10,  # Seconds a keepalive ping or reconnect may take
+    'reconnect_backoff': 1.0,  # Max delay before the first reconnect attempt, doubled per failure
+    'reconnect_backoff_max': 60,
+    'balancing_enabled': False,  # Pick the account when phone is missing or names a pool
+    'pools': {},  # Pool name -> list of phones; "default" is every account
+    'balancing_sticky_slack': 10,  # Extra queued sends tolerated to keep a destination on its account
+    'balancing_flood_window': 300,  # Seconds a FLOOD_WAIT counts against an account
+    'balancing_flood_penalty': 50,  # Load added to an account with a recent FLOOD_WAIT
+    'webhook_url': None,  # Callback URL receiving send results and replies; disabled when empty
+    'webhook_batch_size': 50,  # Max events per callback POST
+    'webhook_flush_interval': 1.0,  # Seconds to wait for a batch to fill up
+    'webhook_max_retries': 5,
+    'webhook_retry_backoff': 1.0,  # Seconds before the first retry, doubled each attempt
+    'webhook_queue_size': 10000,  # Events waiting for delivery before new ones are dropped
+    'webhook_timeout': 10,  # Seconds per callback POST
+    'entity_cache_size': 1000,  # Max cached destinations per account
+    'entity_cache_ttl': 86400,  # Seconds a resolved destination stays cached
+    'entity_cache_negative_ttl': 60,  # Seconds a "not found" destination stays cached
+    'entity_cache_file': os.path.join('config', 'entity_cache.json'),
+    'media_max_size': 2000 * 1024 * 1024,  # Largest file accepted by /send-file, in bytes
+    'media_upload_parallel': 4,  # File parts uploaded at the same time per file
+    'media_max_jobs': 4,  # /send-file uploads running at once per account; more are answered 429
+    'media_cache_size': 1000,  # Uploaded files remembered per account by content hash
+    'media_cache_file': os.path.join('config', 'media_cache.json'),
+    'history_per_chat': 200,  # Recent messages kept per chat for /messages (0 disables)
+    'history_max_chats': 1000,  # Chats kept per account; the least recently active is evicted
+    'stream_buffer_size': 1000,  # Messages buffered per /stream subscriber before it is dropped
+    'stream_max_subscribers': 100,
+    'outbox_enabled': False,  # Persist accepted sends and replay unfinished ones on start
+    'outbox_file': os.path.join('config', 'outbox.db'),
+    'outbox_batch_size': 500,  # Max outbox writes committed in one transaction
+    'outbox_retention': 86400,  # Seconds sent/failed entries are kept in the outbox
+    'capture_file': None,  # gzip NDJSON record of /send-message traffic for replay; disabled when empty
+}
+
+
+class APISettings:
+    def __init__(self, **values):
+        for key, default in DEFAULTS.items():
+            setattr(self, key, values.get(key, default))
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in DEFAULTS}
+
+    @staticmethod
+    def from_dict(data):
+        return APISettings(**{key: value for key, value in data.items() if key in DEFAULTS})
+
+    @staticmethod
+    def load(path=SETTINGS_FILE):
+        """Load settings from file, falling back to defaults if it does not exist"""
+        if not os.path.exists(path):
+            return APISettings()
+        with open(path, 'r') as f:
+            return APISettings.from_dict(json.load(f))
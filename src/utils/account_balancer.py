@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class PoolNotFoundError(Exception):
+    """Raised when a request names a pool that is not configured"""
+    def __init__(self, pool, available):
+        super().__init__(f"Account pool {pool} is not configured")
+        self.pool = pool
+        self.available = available
+
+
+class AccountBalancer:
+    """Pick an account for requests that name a pool instead of a phone.
+
+    A destination sticks to the account that served it last as long as that
+    account is usable and not much busier than the least loaded one; otherwise
+    the account with the lowest load score is chosen.
+    """
+    DEFAULT_POOL = 'default'
+    MAX_AFFINITIES = 10000
+
+    def __init__(self, pools, sticky_slack):
+        self.pools = pools  # pool name -> list of phones; 'default' means every account
+        self.sticky_slack = sticky_slack
+        self.affinity = OrderedDict()  # (pool, destination) -> phone
+
+    def members(self, pool, phones):
+        """Phones of `pool` that are currently loaded"""
+        if pool in self.pools:
+            return [phone for phone in self.pools[pool] if phone in phones]
+        if pool == self.DEFAULT_POOL:
+            return list(phones)
+        raise PoolNotFoundError(pool, [self.DEFAULT_POOL] + list(self.pools))
+
+    def pick(self, pool, destination, phones, load, is_usable):
+        """Choose a phone from `pool` for `destination`, or None if the pool is empty.
+
+        `load(phone)` returns a score (lower is better) and `is_usable(phone)`
+        tells whether the account can take traffic right now.
+        """
+        members = self.members(pool, phones)
+        if not members:
+            return None
+        usable = [phone for phone in members if is_usable(phone)] or members
+        scores = {phone: load(phone) for phone in usable}
+        best = min(usable, key=lambda phone: scores[phone])
+
+        key = (pool, str(destination).strip().lower())
+        sticky = self.affinity.get(key)
+        if sticky in scores and scores[sticky] <= scores[best] + self.sticky_slack:
+            best = sticky
+
+        self.affinity[key] = best
+        self.affinity.move_to_end(key)
+        while len(self.affinity) > self.MAX_AFFINITIES:
+            self.affinity.popitem(last=False)
+        return best
@@ -0,0 +1,27 @@
+import json
+import os
+
+
+def load_caches(path, phones, factory):
+    """Create a cache for every phone with `factory()`, warmed from `path` when it exists"""
+    saved = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            saved = json.load(f)
+    caches = {}
+    for phone in phones:
+        cache = factory()
+        cache.load_dict(saved.get(phone, {}))
+        caches[phone] = cache
+    return caches
+
+
+def save_caches(path, caches):
+    """Write the per-phone caches to `path` atomically"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({phone: cache.to_dict() for phone, cache in caches.items()}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,164 @@
+import asyncio
+import random
+import time
+from telethon.tl import functions
+
+CONNECTED = 'connected'
+RECONNECTING = 'reconnecting'
+DISCONNECTED = 'disconnected'  # The session is no longer authorized; needs a new login
+
+
+class AccountHealth:
+    """Connection state of one account"""
+    def __init__(self):
+        self.state = CONNECTED
+        self.reason = None
+        self.changed_at = time.time()
+        self.last_activity = time.monotonic()
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.task = None  # Running reconnect
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'reason': self.reason,
+            'since': self.changed_at,
+            'reconnects': self.reconnects,
+            'failed_attempts': self.failed_attempts
+        }
+
+
+class ConnectionSupervisor:
+    """Keeps the connection of every account alive.
+
+    Every `interval` seconds each client is checked: a dropped connection is
+    reconnected, and a connection idle for `idle_ping` seconds is pinged so a
+    dead socket is found before a request needs it. Reconnects retry with
+    full-jitter exponential backoff (`backoff` doubling up to `backoff_max`)
+    so accounts dropped together do not reconnect in lockstep. Accounts that
+    are not 'connected' are reported unhealthy. Must be used from the
+    controller's event loop; `clients` is the controller's phone -> client
+    dict and may change while running.
+    """
+    def __init__(self, clients, interval=5, idle_ping=60, ping_timeout=10, backoff=1.0, backoff_max=60,
+                 on_change=None):
+        self.clients = clients
+        self.interval = interval
+        self.idle_ping = idle_ping
+        self.ping_timeout = ping_timeout
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.on_change = on_change  # on_change(phone, state, reason)
+        self.health = {}
+        self.task = None
+        self.pings = 0
+
+    async def start(self):
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop checking and cancel running reconnects"""
+        tasks = [self.task] + [health.task for health in self.health.values()]
+        tasks = [task for task in tasks if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+
+    def _get(self, phone):
+        health = self.health.get(phone)
+        if health is None:
+            health = self.health[phone] = AccountHealth()
+        return health
+
+    def forget(self, phone):
+        """Drop the state of an account that is no longer served"""
+        health = self.health.pop(phone, None)
+        if health and health.task:
+            health.task.cancel()
+
+    def state(self, phone):
+        health = self.health.get(phone)
+        return health.state if health else CONNECTED
+
+    def is_healthy(self, phone):
+        return self.state(phone) == CONNECTED
+
+    def touch(self, phone):
+        """Note a successful Telegram call, which postpones the next keepalive ping"""
+        self._get(phone).last_activity = time.monotonic()
+
+    def report_error(self, phone, error):
+        """A request failed with a connection error: reconnect right away instead of at the next check"""
+        self._schedule_reconnect(phone, f'{type(error).__name__}: {error}')
+
+    def _set_state(self, phone, state, reason=None):
+        health = self._get(phone)
+        if health.state == state:
+            return
+        health.state = state
+        health.reason = reason
+        health.changed_at = time.time()
+        if self.on_change:
+            self.on_change(phone, state, reason)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(*(self._check(phone) for phone in list(self.clients)))
+
+    async def _check(self, phone):
+        health = self._get(phone)
+        client = self.clients.get(phone)
+        if client is None or health.task or health.state == DISCONNECTED:
+            return
+        if not client.is_connected():
+            self._schedule_reconnect(phone, 'connection lost')
+            return
+        if time.monotonic() - health.last_activity < self.idle_ping:
+            return
+        try:
+            self.pings += 1
+            await asyncio.wait_for(client(functions.PingRequest(ping_id=random.getrandbits(63))), self.ping_timeout)
+        except Exception as e:
+            self._schedule_reconnect(phone, f'keepalive ping failed: {type(e).__name__}')
+            return
+        health.last_activity = time.monotonic()
+
+    def _schedule_reconnect(self, phone, reason):
+        health = self._get(phone)
+        if health.task or health.state == DISCONNECTED:
+            return
+        self._set_state(phone, RECONNECTING, reason)
+        health.task = asyncio.ensure_future(self._reconnect(phone, health))
+
+    async def _reconnect(self, phone, health):
+        attempt = 0
+        try:
+            while True:
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+                client = self.clients.get(phone)
+                if client is None:
+                    return
+                try:
+                    # Drop the old (possibly half-open) connection before opening a new one
+                    await client.disconnect()
+                    await asyncio.wait_for(client.connect(), self.ping_timeout)
+                    authorized = await client.is_user_authorized()
+                except Exception:
+                    health.failed_attempts += 1
+                    attempt += 1
+                    continue
+                if not authorized:
+                    self._set_state(phone, DISCONNECTED, 'session is no longer authorized')
+                    return
+                health.reconnects += 1
+                health.last_activity = time.monotonic()
+                self._set_state(phone, CONNECTED)
+                return
+        finally:
+            health.task = None
+
+    def stats(self):
+        return {phone: self._get(phone).to_dict() for phone in list(self.clients)}
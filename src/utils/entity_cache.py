@@ -0,0 +1,85 @@
+import base64
+import time
+from collections import OrderedDict
+from telethon.extensions import BinaryReader
+
+
+class EntityCache:
+    """LRU cache of resolved destinations for a single account.
+
+    Maps destination strings to input peers. A peer of None is a negative entry,
+    remembering for a short time that the destination could not be resolved.
+    """
+    def __init__(self, max_size, ttl, negative_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # key -> (expires_at, input_peer or None)
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(destination):
+        return str(destination).strip().lower()
+
+    def get(self, destination):
+        """Return (hit, input_peer); input_peer is None for a cached "not found" """
+        key = self._key(destination)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        if entry[1] is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, entry[1]
+
+    def put(self, destination, input_peer):
+        """Cache a resolved peer"""
+        self._store(self._key(destination), time.time() + self.ttl, input_peer)
+
+    def put_missing(self, destination):
+        """Cache that a destination could not be resolved"""
+        self._store(self._key(destination), time.time() + self.negative_ttl, None)
+
+    def _store(self, key, expires_at, input_peer):
+        self.entries[key] = (expires_at, input_peer)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses
+        }
+
+    def to_dict(self):
+        """Serialize live entries, oldest first so LRU order survives a reload"""
+        now = time.time()
+        return {
+            key: {
+                'expires_at': expires_at,
+                'peer': base64.b64encode(bytes(peer)).decode('ascii') if peer is not None else None
+            }
+            for key, (expires_at, peer) in self.entries.items()
+            if expires_at > now
+        }
+
+    def load_dict(self, data):
+        now = time.time()
+        for key, entry in data.items():
+            if entry['expires_at'] <= now:
+                continue
+            peer = None
+            if entry['peer'] is not None:
+                with BinaryReader(base64.b64decode(entry['peer'])) as reader:
+                    peer = reader.tgread_object()
+            self._store(key, entry['expires_at'], peer)
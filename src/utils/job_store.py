@@ -0,0 +1,74 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+
+class Job:
+    """State of a send request processed in the background"""
+    def __init__(self, job_id=None, **fields):
+        self.id = job_id or uuid.uuid4().hex
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.fields = fields
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.http_status = None
+        self.result = None
+        self.progress = None  # {'uploaded', 'total'} bytes for file sends
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            **self.fields,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'http_status': self.http_status,
+            'progress': self.progress,
+            'result': self.result
+        }
+
+
+class JobStore:
+    """In-memory job registry keeping at most `max_finished` finished jobs.
+
+    Pending jobs are bounded by the account lanes (and media_max_jobs for file
+    sends); once finished, the oldest jobs are evicted first. Must be used from the controller's event loop.
+    """
+    def __init__(self, max_finished):
+        self.max_finished = max_finished
+        self.pending = {}
+        self.finished = OrderedDict()
+
+    def create(self, job_id=None, **fields):
+        job = Job(job_id, **fields)
+        self.pending[job.id] = job
+        return job
+
+    def discard(self, job):
+        """Forget a job that was never queued"""
+        self.pending.pop(job.id, None)
+
+    def get(self, job_id):
+        return self.pending.get(job_id) or self.finished.get(job_id)
+
+    def start(self, job):
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+
+    def set_progress(self, job, uploaded, total):
+        job.progress = {'uploaded': uploaded, 'total': total}
+
+    def finish(self, job, result, http_status):
+        job.status = 'done' if http_status == 200 else 'failed'
+        job.finished_at = datetime.now().isoformat()
+        job.result = result
+        job.http_status = http_status
+        self.pending.pop(job.id, None)
+        self.finished[job.id] = job
+        while len(self.finished) > self.max_finished:
+            self.finished.popitem(last=False)
+
+    def stats(self):
+        return {'pending': len(self.pending), 'finished': len(self.finished)}
@@ -1,21 +1,190 @@
 import logging
 from datetime import datetime
 import os
-from logging.handlers import TimedRotatingFileHandler
+import atexit
+import gzip
+import queue
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler, QueueHandler, QueueListener
+
+# Async mode is opt-in through environment variables so it also applies to
+# loggers created at import time
+ASYNC_ENV = 'TELEGRAM_LOG_ASYNC'  # "1" to enable
+QUEUE_SIZE_ENV = 'TELEGRAM_LOG_QUEUE_SIZE'
+OVERFLOW_ENV = 'TELEGRAM_LOG_OVERFLOW'  # drop | drop_oldest | block
+MAX_BYTES_ENV = 'TELEGRAM_LOG_MAX_BYTES'
+
+OVERFLOW_POLICIES = ('drop', 'drop_oldest', 'block')
+
+_listeners = {}  # logger name -> running BatchQueueListener
+_compressor = None  # Background executor gzipping rolled log files
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue handler applying an overflow policy when the queue is full"""
+    def __init__(self, log_queue, overflow):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'drop_oldest':
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait(record)
+                    return
+                except (queue.Empty, queue.Full):
+                    pass
+            self.dropped += 1
+
+
+class _DeferredFlushMixin:
+    """Skip the per-record flush; the queue listener flushes once per batch"""
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchStreamHandler(_DeferredFlushMixin, logging.StreamHandler):
+    pass
+
+
+class CompressingRotatingFileHandler(_DeferredFlushMixin, RotatingFileHandler):
+    """Size based rotation; rolled files are gzipped on a background thread"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self._rotate
+        self.compression = None
+
+    def doRollover(self):
+        # Backups are renamed during rollover, so the previous one must be fully written
+        if self.compression is not None:
+            self.compression.result()
+        super().doRollover()
+
+    def _rotate(self, source, dest):
+        # Move the file out of the way right away, compress it later
+        pending = dest[:-len('.gz')] + '.pending'
+        os.replace(source, pending)
+        self.compression = _get_compressor().submit(_compress, pending, dest)
+
+
+def _compress(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _get_compressor():
+    global _compressor
+    if _compressor is None:
+        _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+    return _compressor
+
+
+class BatchQueueListener(QueueListener):
+    """Queue listener writing records in batches and flushing once per batch"""
+    def __init__(self, log_queue, *handlers, batch_size=256):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # Blocking put: the stop marker must get in even when the queue is full
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        log_queue = self.queue
+        has_task_done = hasattr(log_queue, 'task_done')
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                if has_task_done:
+                    log_queue.task_done()
+            for handler in self.handlers:
+                getattr(handler, 'flush_batch', handler.flush)()
+            if stop:
+                break
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def setup_logger(name, async_mode=None, queue_size=None, overflow=None, max_bytes=None):
+    """Create a logger writing to logs/<name>.log and the console.
+
+    In async mode (argument or TELEGRAM_LOG_ASYNC=1) log calls only enqueue the
+    record; a background listener writes batches, rotates by size and gzips
+    rolled files. `overflow` decides what happens when the queue is full.
+    """
+    if async_mode is None:
+        async_mode = _env_flag(ASYNC_ENV)
 
-def setup_logger(name):
     # Create logs directory if it doesn't exist
     logs_dir = 'logs'
     if not os.path.exists(logs_dir):
         os.makedirs(logs_dir)
-    
+
     # Configure logger
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    
+
     # Log file path
     log_file = os.path.join(logs_dir, f'{name}.log')
-    
+
+    # Create formatter
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # Stop the listener of a previous setup of this logger
+    _stop_listener(name)
+
+    # Remove existing handlers if any
+    logger.handlers = []
+
+    if async_mode:
+        queue_size = queue_size or int(os.environ.get(QUEUE_SIZE_ENV, 10000))
+        overflow = overflow or os.environ.get(OVERFLOW_ENV, 'drop')
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        max_bytes = max_bytes or int(os.environ.get(MAX_BYTES_ENV, 10 * 1024 * 1024))
+
+        file_handler = CompressingRotatingFileHandler(
+            filename=log_file,
+            maxBytes=max_bytes,
+            backupCount=3,
+            encoding='utf-8'
+        )
+        console_handler = BatchStreamHandler()
+        file_handler.setFormatter(formatter)
+        console_handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        listener = BatchQueueListener(log_queue, file_handler, console_handler)
+        listener.start()
+        _listeners[name] = listener
+        logger.addHandler(BoundedQueueHandler(log_queue, overflow))
+        return logger
+
     # Create timed rotating file handler
     file_handler = TimedRotatingFileHandler(
         filename=log_file,
@@ -24,20 +193,34 @@ def setup_logger(name):
         backupCount=3,  # Keep logs for 3 days
         encoding='utf-8'
     )
-    
+
     # Console handler
     console_handler = logging.StreamHandler()
-    
-    # Create formatter
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    
-    # Remove existing handlers if any
-    logger.handlers = []
-    
+
     # Add handlers
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
-    
-    return logger
\ No newline at end of file
+
+    return logger
+
+
+def _stop_listener(name):
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def shutdown_logging():
+    """Write out every queued record and finish pending compressions"""
+    for name in list(_listeners):
+        _stop_listener(name)
+    if _compressor is not None:
+        _compressor.shutdown(wait=True)
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,65 @@
+import base64
+from collections import OrderedDict
+from telethon.extensions import BinaryReader
+
+
+class MediaExpiredError(Exception):
+    """Raised when cached media was rejected and there is no file to upload again"""
+    def __init__(self, key):
+        super().__init__("The cached upload for this content expired; send the file again")
+        self.key = key
+
+
+class MediaCache:
+    """LRU cache of uploaded media for a single account.
+
+    Maps a content key (SHA-256 of the file plus how it was sent) to the
+    InputMediaPhoto / InputMediaDocument of the first send, so later sends of
+    the same content reuse it instead of uploading again. Entries are dropped
+    when Telegram reports their file reference as expired.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # key -> input media
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        media = self.entries.get(key)
+        if media is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return media
+
+    def put(self, key, media):
+        self.entries[key] = media
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+    def to_dict(self):
+        """Serialize entries, oldest first so LRU order survives a reload"""
+        return {key: base64.b64encode(bytes(media)).decode('ascii') for key, media in self.entries.items()}
+
+    def load_dict(self, data):
+        for key, encoded in data.items():
+            with BinaryReader(base64.b64decode(encoded)) as reader:
+                self.put(key, reader.tgread_object())
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import tempfile
+from telethon import helpers, utils
+from telethon.tl import functions, types
+
+SPOOL_MEMORY = 1024 * 1024  # Request bodies larger than this are spooled to disk
+CHUNK_SIZE = 64 * 1024  # Bytes read from the request body at a time
+BIG_FILE_SIZE = 10 * 1024 * 1024  # Telegram's threshold for SaveBigFilePartRequest
+
+
+class FileTooLargeError(Exception):
+    """Raised when an uploaded body exceeds the configured maximum size"""
+    def __init__(self, max_size):
+        super().__init__(f"File exceeds the maximum size of {max_size} bytes")
+        self.max_size = max_size
+
+
+def spool(read, max_size):
+    """Copy a blocking `read(n)` stream into a temporary file, returning (file, size, sha256 hex)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLargeError(max_size)
+            digest.update(chunk)
+            spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, size, digest.hexdigest()
+
+
+async def spool_async(chunks, max_size):
+    """Copy an async iterator of byte chunks into a temporary file, returning (file, size, sha256 hex)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLargeError(max_size)
+            digest.update(chunk)
+            spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, size, digest.hexdigest()
+
+
+
+async def part_chunks(part):
+    """Byte chunks of an aiohttp multipart body part, for spool_async"""
+    while True:
+        chunk = await part.read_chunk(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+async def upload_parts(call, source, size, file_name, parallel, progress=None):
+    """Upload a seekable file in parts with up to `parallel` part requests in flight.
+
+    `call(request)` sends one request (so the caller can apply its FLOOD_WAIT
+    handling). A single reader feeds a queue of `parallel` parts, so at most
+    about 2 x parallel parts are held in memory whatever the file size.
+    `progress(uploaded, total)` is called after every part. Returns the
+    InputFile / InputFileBig to send the media with.
+    """
+    loop = asyncio.get_event_loop()
+    part_size = utils.get_appropriated_part_size(size) * 1024
+    part_count = max(1, (size + part_size - 1) // part_size)
+    is_big = size > BIG_FILE_SIZE
+    file_id = helpers.generate_random_long()
+    md5 = hashlib.md5()
+    parts = asyncio.Queue(maxsize=parallel)
+    uploaded = 0
+
+    async def read_parts():
+        for index in range(part_count):
+            part = await loop.run_in_executor(None, source.read, part_size)
+            if not is_big:
+                md5.update(part)
+            await parts.put((index, part))
+        for _ in range(parallel):
+            await parts.put(None)
+
+    async def send_parts():
+        nonlocal uploaded
+        while True:
+            item = await parts.get()
+            if item is None:
+                return
+            index, part = item
+            if is_big:
+                request = functions.upload.SaveBigFilePartRequest(file_id, index, part_count, part)
+            else:
+                request = functions.upload.SaveFilePartRequest(file_id, index, part)
+            if not await call(request):
+                raise RuntimeError(f"Failed to upload file part {index}")
+            uploaded += len(part)
+            if progress:
+                progress(uploaded, size)
+
+    tasks = [asyncio.ensure_future(read_parts())] + [asyncio.ensure_future(send_parts()) for _ in range(parallel)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if is_big:
+        return types.InputFileBig(file_id, part_count, file_name)
+    return types.InputFile(file_id, part_count, file_name, md5.hexdigest())
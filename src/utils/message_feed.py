@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+KEEPALIVE_INTERVAL = 15  # Seconds between SSE comments keeping idle connections open
+
+
+class FeedFullError(Exception):
+    """Raised when the maximum number of stream subscribers is reached"""
+    def __init__(self, max_subscribers):
+        super().__init__(f"Stream subscriber limit of {max_subscribers} reached")
+        self.max_subscribers = max_subscribers
+
+
+class Subscription:
+    """Buffered view of the feed for one consumer, optionally filtered by phone and chat"""
+    def __init__(self, buffer_size, phones=None, chats=None):
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.phones = phones
+        self.chats = chats
+        self.closed_reason = None
+
+    def matches(self, event):
+        return ((not self.phones or event['phone'] in self.phones) and
+                (not self.chats or event['chat_id'] in self.chats))
+
+    async def get(self, timeout=None):
+        """Next event, None once the subscription was dropped; raises TimeoutError after `timeout`"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class MessageFeed:
+    """Fan-out of inbound messages to stream subscribers.
+
+    publish() never waits: a subscriber whose buffer is full is dropped (its
+    buffer is replaced by a single None marker, see `closed_reason`) so a slow
+    consumer cannot hold up the Telegram event loop. Must be used from the
+    controller's event loop.
+    """
+    def __init__(self, buffer_size, max_subscribers):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, phones=None, chats=None):
+        if len(self.subscribers) >= self.max_subscribers:
+            raise FeedFullError(self.max_subscribers)
+        subscription = Subscription(self.buffer_size, phones, chats)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, event):
+        self.published += 1
+        for subscription in list(self.subscribers):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                self._end(subscription, 'slow consumer')
+
+    def _end(self, subscription, reason):
+        self.subscribers.discard(subscription)
+        subscription.closed_reason = reason
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def close(self):
+        """End every subscription, e.g. before the server shuts down"""
+        for subscription in list(self.subscribers):
+            self._end(subscription, 'server stopping')
+
+    async def sse_lines(self, subscription):
+        """Server-Sent Events for a subscription; ends when it is dropped or the feed is closed"""
+        try:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    event = await subscription.get(KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    yield f"event: closed\ndata: {json.dumps({'reason': subscription.closed_reason})}\n\n"
+                    return
+                yield f"event: message\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'published': self.published,
+            'dropped_subscribers': self.dropped
+        }
+
+
+def parse_filter(value, convert=str):
+    """Comma separated query parameter as a set, None when empty; raises ValueError on bad items"""
+    items = {convert(item.strip()) for item in (value or '').split(',') if item.strip()}
+    return items or None
@@ -0,0 +1,75 @@
+import heapq
+import time
+from collections import OrderedDict, deque
+
+
+class MessageHistory:
+    """Recent inbound and outbound messages per account and chat.
+
+    Each chat keeps its last `per_chat` messages in a ring buffer and each
+    account keeps its `max_chats` most recently active chats, so memory is
+    bounded by accounts x max_chats x per_chat messages. Entries are appended
+    in arrival order, which keeps every buffer sorted by `timestamp`. Must be
+    used from the controller's event loop.
+    """
+    def __init__(self, per_chat, max_chats):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self.accounts = {}  # phone -> OrderedDict of chat id -> deque of entries
+
+    def record(self, phone, chat_id, direction, message_id, text, sender_id=None, date=None):
+        """Add a message ('in' or 'out') to the history of a chat"""
+        if not self.per_chat:
+            return
+        chats = self.accounts.setdefault(phone, OrderedDict())
+        messages = chats.get(chat_id)
+        if messages is None:
+            messages = chats[chat_id] = deque(maxlen=self.per_chat)
+            while len(chats) > self.max_chats:
+                chats.popitem(last=False)
+        chats.move_to_end(chat_id)
+        messages.append({
+            'timestamp': time.time(),
+            'direction': direction,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'sender_id': sender_id,
+            'text': text,
+            'date': date.isoformat() if date else None
+        })
+
+    @staticmethod
+    def _after(messages, since):
+        if since is None:
+            return list(messages)
+        # Walk back from the newest entry only as far as needed
+        newer = []
+        for entry in reversed(messages):
+            if entry['timestamp'] <= since:
+                break
+            newer.append(entry)
+        newer.reverse()
+        return newer
+
+    def query(self, phone, chat_id=None, since=None, limit=100):
+        """Messages of one chat (or all chats of the account) in time order.
+
+        With `since` (epoch seconds) the oldest `limit` messages after it are
+        returned, so callers can page forward with the last timestamp seen;
+        without it the newest `limit` messages.
+        """
+        chats = self.accounts.get(phone, {})
+        if chat_id is not None:
+            selected = [chats[chat_id]] if chat_id in chats else []
+        else:
+            selected = list(chats.values())
+        merged = list(heapq.merge(
+            *(self._after(messages, since) for messages in selected), key=lambda entry: entry['timestamp']
+        ))
+        return merged[:limit] if since is not None else merged[-limit:]
+
+    def stats(self):
+        return {
+            phone: {'chats': len(chats), 'messages': sum(len(messages) for messages in chats.values())}
+            for phone, chats in self.accounts.items()
+        }
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    phone TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_STOP = object()
+
+
+class Outbox:
+    """Durable record of accepted sends in a SQLite database in WAL mode.
+
+    A single writer thread owns the connection. Everything queued while the
+    previous transaction was committing is written in the next one (group
+    commit), so concurrent requests share one fsync. `add()` resolves once the
+    entry is committed; `mark()` does not wait. Entries still 'pending' when
+    the process stops are returned by `pending()` on the next start.
+    """
+    def __init__(self, path, batch_size=500, retention=86400):
+        self.path = path
+        self.batch_size = batch_size
+        self.retention = retention  # Seconds finished entries are kept
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.added = 0
+        self.marked = 0
+        self.commits = 0
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Durable across process crashes; WAL keeps commits to one sequential append
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(SCHEMA)
+        conn.execute('CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status)')
+        return conn
+
+    def open(self):
+        """Open the database, drop old finished entries and return the unfinished ones"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM outbox WHERE status != 'pending' AND updated_at < ?",
+                (time.time() - self.retention,)
+            )
+        rows = conn.execute(
+            "SELECT id, phone, destination, message FROM outbox WHERE status = 'pending' ORDER BY created_at"
+        ).fetchall()
+        self.thread = threading.Thread(target=self._run, args=(conn,), name='outbox-writer', daemon=True)
+        self.thread.start()
+        return [dict(zip(('id', 'phone', 'destination', 'message'), row)) for row in rows]
+
+    async def add(self, entry_id, phone, destination, message):
+        """Record an accepted send; returns once it is committed"""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        now = time.time()
+        self.queue.put((
+            'add', (entry_id, phone, destination, message, 'pending', now, now), (loop, future)
+        ))
+        await future
+
+    def mark(self, entry_id, status):
+        """Record the outcome ('sent' or 'failed') of an entry"""
+        if entry_id is not None:
+            self.queue.put(('mark', (status, time.time(), entry_id), None))
+
+    def _run(self, conn):
+        while True:
+            ops = [self.queue.get()]
+            # Whatever piled up meanwhile goes into the same transaction
+            while len(ops) < self.batch_size:
+                try:
+                    ops.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in ops
+            ops = [op for op in ops if op is not _STOP]
+            added = [row for kind, row, _ in ops if kind == 'add']
+            marks = [row for kind, row, _ in ops if kind == 'mark']
+            error = None
+            try:
+                with conn:
+                    if added:
+                        conn.executemany('INSERT OR REPLACE INTO outbox VALUES (?, ?, ?, ?, ?, ?, ?)', added)
+                    if marks:
+                        conn.executemany('UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?', marks)
+                if ops:
+                    self.commits += 1
+                self.added += len(added)
+                self.marked += len(marks)
+            except sqlite3.Error as e:
+                error = e
+            self._resolve([waiter for _, _, waiter in ops if waiter], error)
+            if stop:
+                conn.close()
+                return
+
+    @staticmethod
+    def _resolve(waiters, error):
+        by_loop = {}
+        for loop, future in waiters:
+            by_loop.setdefault(loop, []).append(future)
+        for loop, futures in by_loop.items():
+            # One wakeup of the event loop per commit
+            loop.call_soon_threadsafe(_set_results, futures, error)
+
+    def close(self):
+        """Commit everything queued so far and stop the writer thread"""
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+
+    def stats(self):
+        return {
+            'added': self.added,
+            'marked': self.marked,
+            'commits': self.commits,
+            'queued': self.queue.qsize()
+        }
+
+
+def _set_results(futures, error):
+    for future in futures:
+        if future.done():
+            continue
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
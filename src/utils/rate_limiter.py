@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class RateLimitedError(Exception):
+    """Raised when a send would have to wait longer than allowed"""
+    def __init__(self, phone, retry_after, reason):
+        super().__init__(f"{phone} is rate limited ({reason}), retry after {retry_after:.1f}s")
+        self.phone = phone
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Classic token bucket; a rate of 0 disables the bucket"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available"""
+        if not self.rate:
+            return 0
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+
+class AccountRateLimiter:
+    """Send limits of one account: a global sends/sec bucket, per-destination
+    sends/min buckets and a parking period set by Telegram's FLOOD_WAIT errors.
+
+    Waits up to `max_wait` seconds for a slot; longer waits are rejected with
+    RateLimitedError reporting how long the caller should back off.
+    """
+    MAX_DESTINATIONS = 10000
+
+    def __init__(self, phone, per_second, burst, per_destination_per_minute, max_wait):
+        self.phone = phone
+        self.per_second = per_second
+        self.burst = burst
+        self.per_destination_per_minute = per_destination_per_minute
+        self.max_wait = max_wait
+        self.global_bucket = TokenBucket(per_second, burst)
+        self.destination_buckets = OrderedDict()
+        self.parked_until = 0
+        self.last_flood_wait = None
+        self.flood_waits = 0
+        self.rejected = 0
+
+    def park(self, seconds):
+        """Stop all sends of this account for `seconds` (FLOOD_WAIT)"""
+        self.last_flood_wait = time.monotonic()
+        self.parked_until = max(self.parked_until, self.last_flood_wait + seconds)
+        self.flood_waits += 1
+
+    def recent_flood_wait(self, window):
+        """Whether a FLOOD_WAIT was hit in the last `window` seconds"""
+        return self.last_flood_wait is not None and time.monotonic() - self.last_flood_wait < window
+
+    def parked_for(self):
+        return max(0.0, self.parked_until - time.monotonic())
+
+    def _reject(self, wait, reason):
+        self.rejected += 1
+        raise RateLimitedError(self.phone, wait, reason)
+
+    async def wait_until_unparked(self):
+        """Sleep through a short FLOOD_WAIT park, reject if it is too long"""
+        wait = self.parked_for()
+        if wait > self.max_wait:
+            self._reject(wait, 'flood wait')
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _destination_bucket(self, destination):
+        bucket = self.destination_buckets.get(destination)
+        if bucket is None:
+            rate = self.per_destination_per_minute / 60.0
+            bucket = TokenBucket(rate, max(1, self.per_destination_per_minute))
+            self.destination_buckets[destination] = bucket
+            while len(self.destination_buckets) > self.MAX_DESTINATIONS:
+                self.destination_buckets.popitem(last=False)
+        self.destination_buckets.move_to_end(destination)
+        return bucket
+
+    async def acquire(self, destination):
+        """Wait for a send slot towards `destination`"""
+        bucket = self._destination_bucket(destination)
+        while True:
+            now = time.monotonic()
+            waits = {
+                'flood wait': self.parked_for(),
+                'account rate': self.global_bucket.wait_time(now),
+                'destination rate': bucket.wait_time(now)
+            }
+            reason, wait = max(waits.items(), key=lambda item: item[1])
+            if wait <= 0:
+                break
+            if wait > self.max_wait:
+                self._reject(wait, reason)
+            await asyncio.sleep(wait)
+        self.global_bucket.take()
+        bucket.take()
+
+    def stats(self):
+        return {
+            'parked_for': round(self.parked_for(), 1),
+            'flood_waits': self.flood_waits,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,55 @@
+import asyncio
+from collections import deque
+
+
+class ReplyRouter:
+    """Match incoming private messages to the send requests waiting for them.
+
+    Waiters are keyed by (phone, chat id) so a reply can only complete a request
+    sent by the same account to the same conversation. Must be used from the
+    event loop the clients run on.
+    """
+    def __init__(self):
+        self.waiters = {}  # (phone, chat_id) -> deque of futures, oldest first
+
+    def expect(self, phone, chat_id):
+        """Register interest in the next reply; call before sending to avoid races"""
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault((phone, chat_id), deque()).append(future)
+        return future
+
+    def dispatch(self, phone, chat_id, text):
+        """Hand a reply to the oldest waiter for this conversation, return True if one took it"""
+        key = (phone, chat_id)
+        waiters = self.waiters.get(key)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(text)
+                if not waiters:
+                    del self.waiters[key]
+                return True
+        self.waiters.pop(key, None)
+        return False
+
+    def discard(self, phone, chat_id, future):
+        """Forget a waiter that timed out or failed"""
+        key = (phone, chat_id)
+        waiters = self.waiters.get(key)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+        if not waiters:
+            del self.waiters[key]
+
+    async def wait(self, phone, chat_id, future, timeout):
+        """Wait up to `timeout` seconds for the reply, returning its text or None"""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.discard(phone, chat_id, future)
@@ -0,0 +1,116 @@
+import asyncio
+
+
+class QueueFullError(Exception):
+    """Raised when an account lane cannot accept more requests"""
+    def __init__(self, phone, depth):
+        super().__init__(f"Send queue for {phone} is full ({depth} pending requests)")
+        self.phone = phone
+        self.depth = depth
+
+
+class AccountLane:
+    """Ordered queue of send jobs for a single account, drained by one worker"""
+    def __init__(self, phone, queue_depth):
+        self.phone = phone
+        self.queue = asyncio.Queue(maxsize=queue_depth)
+        self.in_flight = 0
+        self.worker = None
+
+    def depth(self):
+        """Number of jobs waiting plus the one being processed"""
+        return self.queue.qsize() + self.in_flight
+
+
+class SendScheduler:
+    """Run send jobs concurrently across accounts while keeping order per account.
+
+    Every method must be called from the event loop the clients run on.
+    """
+    def __init__(self, queue_depth):
+        self.queue_depth = queue_depth
+        self.lanes = {}
+
+    def _get_lane(self, phone):
+        lane = self.lanes.get(phone)
+        if lane is None:
+            lane = AccountLane(phone, self.queue_depth)
+            lane.worker = asyncio.ensure_future(self._worker(lane))
+            self.lanes[phone] = lane
+        return lane
+
+    async def submit(self, phone, job, wait=False):
+        """Queue `job` (a coroutine function) on the lane of `phone` and wait for its result.
+
+        A full lane raises QueueFullError, unless `wait` is set in which case the
+        caller waits for room in the lane.
+        """
+        if not wait:
+            return await self.enqueue(phone, job)
+        lane = self._get_lane(phone)
+        future = asyncio.get_event_loop().create_future()
+        await lane.queue.put((job, future))
+        return await future
+
+    def enqueue(self, phone, job):
+        """Queue `job` without waiting, returning a future for its result.
+
+        Raises QueueFullError right away when the lane is full.
+        """
+        lane = self._get_lane(phone)
+        future = asyncio.get_event_loop().create_future()
+        try:
+            lane.queue.put_nowait((job, future))
+        except asyncio.QueueFull:
+            raise QueueFullError(phone, lane.queue.qsize())
+        return future
+
+    async def _worker(self, lane):
+        while True:
+            job, future = await lane.queue.get()
+            try:
+                # The caller gave up (e.g. HTTP timeout) before the job started
+                if future.cancelled():
+                    continue
+                lane.in_flight += 1
+                try:
+                    result = await job()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    lane.in_flight -= 1
+            finally:
+                lane.queue.task_done()
+
+    def depth(self, phone):
+        """Current number of pending and running jobs for `phone`"""
+        lane = self.lanes.get(phone)
+        return lane.depth() if lane else 0
+
+    async def remove(self, phone):
+        """Wait until the lane of `phone` has finished its queued jobs, then stop its worker"""
+        lane = self.lanes.get(phone)
+        if lane is None:
+            return
+        await lane.queue.join()
+        lane.worker.cancel()
+        await asyncio.gather(lane.worker, return_exceptions=True)
+        if self.lanes.get(phone) is lane:
+            del self.lanes[phone]
+
+    async def close(self):
+        """Stop all workers, failing any job that is still queued"""
+        for lane in self.lanes.values():
+            lane.worker.cancel()
+            while not lane.queue.empty():
+                _, future = lane.queue.get_nowait()
+                if not future.done():
+                    future.cancel()
+        await asyncio.gather(*(lane.worker for lane in self.lanes.values()), return_exceptions=True)
+        self.lanes.clear()
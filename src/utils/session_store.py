@@ -0,0 +1,375 @@
+import datetime
+import os
+import sqlite3
+import threading
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession
+from telethon.tl import types
+from telethon import utils
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    dc_id INTEGER,
+    server_address TEXT,
+    port INTEGER,
+    auth_key BLOB,
+    takeout_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS entities (
+    name TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    username TEXT,
+    phone TEXT,
+    entity_name TEXT,
+    PRIMARY KEY (name, id)
+);
+CREATE INDEX IF NOT EXISTS entities_username ON entities (name, username);
+CREATE INDEX IF NOT EXISTS entities_phone ON entities (name, phone);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (name, entity_name);
+CREATE TABLE IF NOT EXISTS update_state (
+    name TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    pts INTEGER,
+    qts INTEGER,
+    date INTEGER,
+    seq INTEGER,
+    PRIMARY KEY (name, id)
+);
+"""
+
+
+class SessionStore:
+    """Telegram sessions of all accounts in a single SQLite database.
+
+    Connection info and update state of every account are read with two
+    queries on open(); entities are only queried when needed. Changes
+    (connection info, entities and update state) are collected and written by
+    one background thread every `flush_interval` seconds in a single
+    transaction, so accounts share one file and one commit instead of a file,
+    a connection and a commit each. A new auth key is written right away. Sessions not in the store yet are imported from
+    their `<name>.session` file when it exists; the file is left untouched.
+    """
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.conn = None  # Used by the writer thread
+        self.reader = None  # Entity lookups from the event loop
+        self.loaded = {}  # name -> saved session data, until the session is created
+        self.opened = set()  # Names whose session was created in this run
+        self.lock = threading.Lock()
+        self.pending_sessions = {}  # name -> sessions row
+        self.pending_entities = {}  # (name, id) -> entities row
+        self.pending_states = {}  # (name, id) -> update_state row
+        self.deleted = set()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.commits = 0
+        self.rows_written = 0
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.loaded = self._read(self.conn, named=True)
+        # WAL lets lookups run while the writer thread commits
+        self.reader = sqlite3.connect(self.path, check_same_thread=False)
+        self.thread = threading.Thread(target=self._run, name='session-store', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _read(conn, named):
+        """Session data by name; `named` is False for a Telethon .session file (a single unnamed session).
+
+        Entities are only read from .session files, which are imported whole.
+        """
+        data = {}
+        name_column, entity_name_column = ('name', 'entity_name') if named else ("''", 'name')
+
+        def entry(name):
+            return data.setdefault(name, {'session': None, 'entities': [], 'states': []})
+
+        for row in conn.execute(f'SELECT {name_column}, dc_id, server_address, port, auth_key, takeout_id FROM sessions'):
+            entry(row[0])['session'] = row[1:]
+        if not named:
+            for row in conn.execute(f'SELECT {name_column}, id, hash, username, phone, {entity_name_column} FROM entities'):
+                entry(row[0])['entities'].append(row[1:])
+        for row in conn.execute(f'SELECT {name_column}, id, pts, qts, date, seq FROM update_state'):
+            entry(row[0])['states'].append(row[1:])
+        return data
+
+    def session(self, name):
+        """The StoredSession for `name` (e.g. telegram_session_+84...), importing its .session file once"""
+        imported = False
+        if name in self.opened:
+            # Created before in this run (e.g. an account connected again after a reload)
+            data = self._load(name)
+        else:
+            data = self.loaded.pop(name, None)
+        if data is None and name not in self.opened and os.path.exists(f'{name}.session'):
+            conn = sqlite3.connect(f'{name}.session')
+            try:
+                data = self._read(conn, named=False).get('')
+            except sqlite3.Error:
+                # Not a complete Telethon session file
+                data = None
+            finally:
+                conn.close()
+            imported = data is not None
+        self.opened.add(name)
+        session = StoredSession(self, name, data)
+        if imported:
+            session.persist_all()
+        return session
+
+    def _load(self, name):
+        """Saved data of one session, including the changes not written yet"""
+        session = self.reader.execute(
+            'SELECT dc_id, server_address, port, auth_key, takeout_id FROM sessions WHERE name = ?', (name,)
+        ).fetchone()
+        states = {
+            row[0]: row[1:]
+            for row in self.reader.execute('SELECT id, pts, qts, date, seq FROM update_state WHERE name = ?', (name,))
+        }
+        with self.lock:
+            if name in self.deleted:
+                return None
+            session = self.pending_sessions.get(name, session)
+            # Pending entities are kept in memory until written, like in the session that queued them
+            entities = [row for (entity_name, _), row in self.pending_entities.items() if entity_name == name]
+            states.update(
+                (entity_id, row) for (state_name, entity_id), row in self.pending_states.items() if state_name == name
+            )
+        return {'session': session, 'entities': entities, 'states': [(entity_id, *row) for entity_id, row in states.items()]}
+
+    def find_entity(self, name, column, value):
+        """Saved entity row of a session whose `column` equals `value`, or None"""
+        return self.reader.execute(
+            f'SELECT id, hash, username, phone, entity_name FROM entities WHERE name = ? AND {column} = ? LIMIT 1',
+            (name, value)
+        ).fetchone()
+
+    def changed_session(self, name, row, urgent=False):
+        with self.lock:
+            self.deleted.discard(name)
+            self.pending_sessions[name] = row
+        if urgent:
+            self.wakeup.set()
+
+    def changed_entities(self, name, rows):
+        with self.lock:
+            for row in rows:
+                self.pending_entities[(name, row[0])] = row
+
+    def changed_state(self, name, entity_id, row):
+        with self.lock:
+            self.pending_states[(name, entity_id)] = row
+
+    def delete(self, name):
+        """Forget a session (after a log out)"""
+        with self.lock:
+            self.pending_sessions.pop(name, None)
+            self.pending_entities = {key: row for key, row in self.pending_entities.items() if key[0] != name}
+            self.pending_states = {key: row for key, row in self.pending_states.items() if key[0] != name}
+            self.deleted.add(name)
+        self.wakeup.set()
+
+    def flush(self):
+        """Write every pending change in one transaction"""
+        with self.lock:
+            sessions, self.pending_sessions = self.pending_sessions, {}
+            entities, self.pending_entities = self.pending_entities, {}
+            states, self.pending_states = self.pending_states, {}
+            deleted, self.deleted = self.deleted, set()
+        if not (sessions or entities or states or deleted):
+            return
+        with self.conn:
+            for table in ('sessions', 'entities', 'update_state'):
+                self.conn.executemany(f'DELETE FROM {table} WHERE name = ?', [(name,) for name in deleted])
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)',
+                [(name, *row) for name, row in sessions.items()]
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)',
+                [(name, *row) for (name, _), row in entities.items()]
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO update_state VALUES (?, ?, ?, ?, ?, ?)',
+                [(name, entity_id, *row) for (name, entity_id), row in states.items()]
+            )
+        self.commits += 1
+        self.rows_written += len(sessions) + len(entities) + len(states) + len(deleted)
+
+    def _run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Write the remaining changes and close the database"""
+        if self.thread:
+            self.stopping = True
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+        if self.conn:
+            self.flush()
+            self.conn.close()
+            self.reader.close()
+            self.conn = None
+            self.reader = None
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.pending_sessions) + len(self.pending_entities) + len(self.pending_states)
+        return {
+            'file': self.path,
+            'commits': self.commits,
+            'rows_written': self.rows_written,
+            'pending_rows': pending
+        }
+
+
+class StoredSession(MemorySession):
+    """Telethon session saved through a SessionStore.
+
+    Connection info and update state live in memory. Known entities stay in
+    the database and are looked up by indexed queries when Telethon needs
+    one; entities changed since the last batch was written are served from
+    memory first.
+    """
+    def __init__(self, store, name, data=None):
+        super().__init__()
+        self.store = store
+        self.name = name
+        self._rows = {}  # id -> (id, hash, username, phone, name) not written yet (or imported)
+        self._by_username = {}
+        self._by_phone = {}
+        self._by_name = {}
+        if not data:
+            return
+        if data['session']:
+            dc_id, server_address, port, auth_key, takeout_id = data['session']
+            super().set_dc(dc_id, server_address, port)
+            self._auth_key = AuthKey(data=auth_key) if auth_key else None
+            self._takeout_id = takeout_id
+        for row in data['entities']:
+            self._index(tuple(row))
+        for entity_id, pts, qts, date, seq in data['states']:
+            self._update_states[entity_id] = types.updates.State(
+                pts, qts, datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc), seq, unread_count=0
+            )
+
+    def clone(self, to_instance=None):
+        # Used for connections to other data centers, which are not saved
+        return to_instance or MemorySession()
+
+    def _session_row(self):
+        return (self._dc_id, self._server_address, self._port,
+                self._auth_key.key if self._auth_key else None, self._takeout_id)
+
+    def persist_all(self):
+        """Queue everything for writing, e.g. after importing a .session file"""
+        self.store.changed_session(self.name, self._session_row(), urgent=True)
+        self.store.changed_entities(self.name, list(self._rows.values()))
+        for entity_id, state in self._update_states.items():
+            self.set_update_state(entity_id, state)
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self.store.changed_session(self.name, self._session_row())
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        # Losing the key means logging in again, so it does not wait for the next batch
+        self.store.changed_session(self.name, self._session_row(), urgent=True)
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self.store.changed_session(self.name, self._session_row())
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        self.store.changed_state(
+            self.name, entity_id, (state.pts, state.qts, int(state.date.timestamp()), state.seq)
+        )
+
+    def _index(self, row):
+        entity_id, entity_hash, username, phone, name = row
+        if phone is not None:
+            # .session files store phone numbers as integers
+            phone = str(phone)
+            row = (entity_id, entity_hash, username, phone, name)
+        old = self._rows.get(entity_id)
+        if old:
+            for index, key in ((self._by_username, old[2]), (self._by_phone, old[3]), (self._by_name, old[4])):
+                if key is not None and index.get(key) == entity_id:
+                    del index[key]
+        self._rows[entity_id] = row
+        for index, key in ((self._by_username, username), (self._by_phone, phone), (self._by_name, name)):
+            if key is not None:
+                index[key] = entity_id
+        return row
+
+    def process_entities(self, tlo):
+        changed = []
+        for row in self._entities_to_rows(tlo):
+            if self._rows.get(row[0]) != row:
+                changed.append(self._index(row))
+        if changed:
+            self.store.changed_entities(self.name, changed)
+
+    def _lookup(self, index, column, key):
+        entity_id = index.get(key)
+        if entity_id is not None:
+            return entity_id, self._rows[entity_id][1]
+        row = self.store.find_entity(self.name, column, key)
+        # A newer version of the entity in memory (e.g. a changed username) wins over the database
+        if row and self._rows.get(row[0], row) == row:
+            return row[0], row[1]
+        return None
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._lookup(self._by_phone, 'phone', phone)
+
+    def get_entity_rows_by_username(self, username):
+        return self._lookup(self._by_username, 'username', username)
+
+    def get_entity_rows_by_name(self, name):
+        return self._lookup(self._by_name, 'entity_name', name)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            ids = (id,)
+        else:
+            ids = (
+                utils.get_peer_id(types.PeerUser(id)),
+                utils.get_peer_id(types.PeerChat(id)),
+                utils.get_peer_id(types.PeerChannel(id))
+            )
+        for entity_id in ids:
+            row = self._rows.get(entity_id) or self.store.find_entity(self.name, 'id', entity_id)
+            if row:
+                return row[0], row[1]
+        return None
+
+    def save(self):
+        # Changes are already queued and written with the next batch
+        pass
+
+    def delete(self):
+        self._rows.clear()
+        self._by_username.clear()
+        self._by_phone.clear()
+        self._by_name.clear()
+        self.store.delete(self.name)
@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 10000  # Records waiting for the writer before new ones are dropped
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of the compressed stream while traffic flows
+
+_STOP = object()
+
+
+class TrafficCapture:
+    """Record of /send-message traffic as gzip compressed NDJSON.
+
+    Every start appends a gzip member opening with a header line
+    ({"v": 1, "started": epoch}); each request is one line with short keys:
+    t (seconds since started), p (phone), d (destination), m (message),
+    a (1 for ?async=1), s (HTTP status), l (latency) and r (seconds until the
+    reply, null without one). record() only enqueues; a background thread
+    compresses and writes, so capturing never blocks the event loop.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.thread = None
+        self.started = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.started = time.time()
+        stream = gzip.open(self.path, 'ab')
+        stream.write(self._line({'v': 1, 'started': round(self.started, 3)}))
+        self.thread = threading.Thread(target=self._run, args=(stream,), name='traffic-capture', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _line(entry):
+        return (json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+
+    def record(self, data, run_async, received_at, status, latency, body):
+        """Add one /send-message request and its outcome"""
+        reply_time = None
+        if isinstance(body, dict) and body.get('response') is not None:
+            reply_time = body.get('response_time')
+        entry = {
+            't': round(received_at - self.started, 4),
+            'p': data.get('phone'),
+            'd': data.get('destination'),
+            'm': data.get('message'),
+            'a': 1 if run_async else 0,
+            's': status,
+            'l': round(latency, 4),
+            'r': round(reply_time, 4) if reply_time is not None else None
+        }
+        try:
+            self.queue.put_nowait(entry)
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self, stream):
+        last_flush = time.monotonic()
+        unflushed = False
+        try:
+            while True:
+                try:
+                    entry = self.queue.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    entry = None
+                if entry is _STOP:
+                    return
+                if entry is not None:
+                    stream.write(self._line(entry))
+                    unflushed = True
+                # Flush at most once per interval so the compressor keeps working on large blocks
+                if unflushed and time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    stream.flush()
+                    last_flush = time.monotonic()
+                    unflushed = False
+        finally:
+            stream.close()
+
+    def close(self):
+        """Write the queued records and close the file"""
+        if self.thread:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        return {
+            'file': self.path,
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'queued': self.queue.qsize()
+        }
+
+
+def read_capture(path):
+    """Requests of a capture file in order, each with its absolute `time` (epoch seconds) added"""
+    started = 0.0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line of a capture whose writer was killed
+                    continue
+                if 'v' in entry:
+                    started = entry['started']
+                    continue
+                entry['time'] = started + entry['t']
+                yield entry
+        except EOFError:
+            # Unterminated gzip member: the process stopped without closing the capture
+            return
@@ -0,0 +1,122 @@
+import asyncio
+import random
+
+
+class WebhookDispatcher:
+    """Deliver events to a callback URL in batches from the event loop.
+
+    Events are queued with publish() and POSTed as {"events": [...]} once
+    `batch_size` events are waiting or `flush_interval` seconds have passed.
+    Failed deliveries are retried with exponential backoff over a keep-alive
+    connection pool.
+    """
+    def __init__(self, url, batch_size, flush_interval, max_retries, retry_backoff,
+                 queue_size, timeout, log):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.log = log
+        self.queue = None
+        self.session = None
+        self.task = None
+        self.current = []  # Batch being collected or delivered
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    async def start(self):
+        """Open the HTTP session and start the delivery task on the running loop"""
+        try:
+            import aiohttp
+        except ImportError:
+            raise RuntimeError("Webhook delivery requires aiohttp (pip install aiohttp)")
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self.task = asyncio.ensure_future(self._run())
+
+    def publish(self, event):
+        """Queue an event for delivery; never blocks, drops the event if the queue is full"""
+        if self.queue is None:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _next_batch(self):
+        # Collected in self.current so close() can still flush it after cancelling
+        batch = self.current = []
+        batch.append(await self.queue.get())
+        deadline = asyncio.get_event_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - asyncio.get_event_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            await self._deliver(batch)
+            self.current = []
+
+    async def _deliver(self, batch):
+        import aiohttp
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.session.post(self.url, json={'events': batch}) as response:
+                    if response.status < 300:
+                        self.delivered += len(batch)
+                        return
+                    error = f"HTTP {response.status}"
+                    # Client errors other than rate limiting will not succeed on retry
+                    if 400 <= response.status < 500 and response.status not in (408, 429):
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            if attempt < self.max_retries:
+                delay = self.retry_backoff * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        self.failed += len(batch)
+        self.log(f"Webhook delivery of {len(batch)} events to {self.url} failed: {error}", 'error')
+
+    async def close(self, timeout=5):
+        """Flush queued events (best effort within `timeout`) and close the session"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        pending = self.current
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        
+        async def flush():
+            for start in range(0, len(pending), self.batch_size):
+                await self._deliver(pending[start:start + self.batch_size])
+        
+        try:
+            await asyncio.wait_for(flush(), timeout)
+        except asyncio.TimeoutError:
+            self.log("Webhook flush on shutdown timed out", 'warning')
+        await self.session.close()
+        self.task = None
+        self.queue = None
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize() if self.queue else 0,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,139 @@
+import getpass
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.utils.logger_config import setup_logger
+
+# Setup logger
+logger = setup_logger('telegram_headless')
+
+CODE_SOURCES = ('stdin', 'file', 'http')
+
+
+class HeadlessView:
+    """View for running the API without a display.
+
+    Messages go to the log only. Login codes for accounts without a session come
+    from stdin, from a file `<code_dir>/<phone>.code` that is deleted once read,
+    or from `POST /login-code {"phone": ..., "code": ...}` on a small local HTTP
+    endpoint that only runs while a code is awaited. Two-step verification
+    passwords come from the same source (`<phone>.password`, `/login-password`).
+    """
+    def __init__(self, code_source='stdin', code_dir=os.path.join('config', 'login_codes'),
+                 code_host='127.0.0.1', code_port=5099, code_timeout=300):
+        if code_source not in CODE_SOURCES:
+            raise ValueError(f"Unknown login code source: {code_source}")
+        self.code_source = code_source
+        self.code_dir = code_dir
+        self.code_host = code_host
+        self.code_port = code_port
+        self.code_timeout = code_timeout
+        self.status = None
+
+    def log_message(self, message, level='info'):
+        """Log a message to file and console"""
+        if level == 'error':
+            logger.error(message)
+        elif level == 'warning':
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+    def update_api_status(self, status, color):
+        """Record the API status (the color is only meaningful in the UI)"""
+        self.status = status
+        self.log_message(f"API Status changed to: {status}")
+
+    def request_login_code(self, phone, api_id):
+        """Wait for the login code of an account; returns None if none arrives in time"""
+        self.log_message(f"Login code required for {phone} (API ID: {api_id}), reading it from {self.code_source}")
+        return self._read_secret(phone, 'code')
+
+    def request_password(self, phone):
+        """Wait for the two-step verification password of an account, from the same source as login codes"""
+        self.log_message(f"Two-step verification password required for {phone}, reading it from {self.code_source}")
+        return self._read_secret(phone, 'password')
+
+    def _read_secret(self, phone, kind):
+        if self.code_source == 'stdin':
+            return self._secret_from_stdin(phone, kind)
+        if self.code_source == 'file':
+            return self._secret_from_file(phone, kind)
+        return self._secret_from_http(phone, kind)
+
+    def _secret_from_stdin(self, phone, kind):
+        if not sys.stdin or not sys.stdin.isatty():
+            self.log_message(f"stdin is not a terminal, cannot read login {kind}", 'error')
+            return None
+        if kind == 'password':
+            return getpass.getpass(f"Two-step verification password for {phone}: ") or None
+        return input(f"Code for {phone}: ").strip() or None
+
+    def _secret_from_file(self, phone, kind):
+        os.makedirs(self.code_dir, exist_ok=True)
+        path = os.path.join(self.code_dir, f'{phone}.{kind}')
+        self.log_message(f"Waiting for login {kind} in {path}")
+        deadline = time.monotonic() + self.code_timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    secret = f.read().strip()
+                os.remove(path)
+                if secret:
+                    return secret
+            time.sleep(1)
+        self.log_message(f"Timed out waiting for login {kind} of {phone}", 'error')
+        return None
+
+    def _secret_from_http(self, phone, kind):
+        received = {}
+        arrived = threading.Event()
+        view = self
+        endpoint = f'/login-{kind}'
+
+        class LoginCodeHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._reply(200, {'awaiting': phone, 'endpoint': endpoint})
+
+            def do_POST(self):
+                if self.path != endpoint:
+                    return self._reply(404, {'error': 'Not found', 'endpoint': endpoint})
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._reply(400, {'error': 'Invalid JSON'})
+                if data.get('phone') != phone or not str(data.get(kind, '')).strip():
+                    return self._reply(400, {'error': 'Missing parameters', 'awaiting': phone, 'required': ['phone', kind]})
+                received[kind] = str(data[kind]).strip()
+                arrived.set()
+                self._reply(200, {'success': True})
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                view.log_message(f"Login {kind} endpoint: {format % args}")
+
+        server = ThreadingHTTPServer((self.code_host, self.code_port), LoginCodeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.log_message(
+            f"Waiting for login {kind}: POST http://{self.code_host}:{self.code_port}{endpoint} "
+            f'{{"phone": "{phone}", "{kind}": "..."}}'
+        )
+        try:
+            if not arrived.wait(self.code_timeout):
+                self.log_message(f"Timed out waiting for login {kind} of {phone}", 'error')
+                return None
+            return received[kind]
+        finally:
+            server.shutdown()
+            server.server_close()
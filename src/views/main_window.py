@@ -1,19 +1,27 @@
 from datetime import datetime
 import tkinter as tk
-from tkinter import messagebox, scrolledtext
+from tkinter import messagebox, scrolledtext, simpledialog
 import threading
 import os
 import json
 import uuid
+from collections import deque
+from queue import SimpleQueue, Empty
 from src.controllers.api_controller import APIController
+from src.views.components.code_dialog import CodeInputDialog
 from src.utils.logger_config import setup_logger
 
 # Setup logger
 logger = setup_logger('telegram_ui')
 
+LOG_MAX_LINES = 1000  # Lines kept in the log area
+LOG_FLUSH_MS = 100  # Interval between log area updates
+LOG_BATCH_SIZE = 500  # Max lines moved into the log area per update
+
 class MainWindow:
     def __init__(self, root):
         self.root = root
+        self.ui_thread = threading.current_thread()  # Thread running the Tk main loop
         self.root.title("Telegram Client")
         self.root.geometry("785x400")  # Initial size
         self.root.resizable(False, True)  # Allow only vertical resizing
@@ -61,10 +69,26 @@ class MainWindow:
         log_frame = tk.LabelFrame(self.main_frame, text="Logs", padx=5, pady=5)
         log_frame.grid(row=4, column=0, columnspan=2, sticky='ew', pady=10)
         
+        # Log controls: pause updates and filter visible lines
+        log_controls = tk.Frame(log_frame)
+        log_controls.pack(fill='x')
+        self.log_paused = tk.BooleanVar(value=False)
+        tk.Checkbutton(log_controls, text="Pause", variable=self.log_paused,
+                       command=self._render_logs).pack(side=tk.LEFT)
+        tk.Label(log_controls, text="Filter:").pack(side=tk.LEFT, padx=5)
+        self.log_filter = tk.StringVar()
+        self.log_filter.trace_add('write', lambda *args: self._render_logs())
+        tk.Entry(log_controls, textvariable=self.log_filter, width=30).pack(side=tk.LEFT)
+        
         # Add Log Text Area
         self.log_area = scrolledtext.ScrolledText(log_frame, width=80, height=10)
         self.log_area.pack(fill='both', expand=True)
         
+        # Log lines are queued from any thread and drained on the Tk main loop
+        self.log_queue = SimpleQueue()
+        self.log_history = deque(maxlen=LOG_MAX_LINES)
+        self.root.after(LOG_FLUSH_MS, self._drain_logs)
+        
         # Load existing config
         self.load_config()
 
@@ -247,17 +271,90 @@ class MainWindow:
         self.status_label.config(text=f"API Status: {status}", fg=color)
         self.log_message(f"API Status changed to: {status}")
 
+    def request_login_code(self, phone, api_id):
+        """Ask the user for the login code of an account in a modal dialog; safe to call from any thread"""
+        return self._ask_on_ui_thread(lambda: CodeInputDialog(self.root, phone=phone, api_id=api_id).get_code())
+
+    def request_password(self, phone):
+        """Ask the user for the two-step verification password of an account; safe to call from any thread"""
+        return self._ask_on_ui_thread(lambda: simpledialog.askstring(
+            "Two-Step Verification",
+            f"Password for {phone}:",
+            show='*',
+            parent=self.root,
+        ))
+
+    def _ask_on_ui_thread(self, ask):
+        """Run a modal dialog on the Tk thread and return its answer"""
+        if threading.current_thread() is self.ui_thread:
+            return ask()
+        
+        # Accounts added by a credentials reload log in from a worker thread; Tk widgets
+        # may only be created on the main loop, so the dialog is shown there
+        answer = {}
+        done = threading.Event()
+        
+        def run():
+            try:
+                answer['value'] = ask()
+            finally:
+                done.set()
+        
+        try:
+            self.root.after(0, run)
+        except (RuntimeError, tk.TclError):
+            # The window is closing
+            return None
+        done.wait()
+        return answer.get('value')
+
     def log_message(self, message, level='info'):
-        """Log a message to UI and file"""
+        """Log a message to UI and file; safe to call from any thread, never blocks"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_text = f"[{timestamp}] {message}\n"
-        
-        self.log_area.insert(tk.END, log_text)
-        self.log_area.see(tk.END)
+        self.log_queue.put(f"[{timestamp}] {message}\n")
         
         if level == 'info':
             logger.info(message)
         elif level == 'error':
             logger.error(message)
         elif level == 'warning':
-            logger.warning(message)
\ No newline at end of file
+            logger.warning(message)
+
+    def _drain_logs(self):
+        """Move queued log lines into the log area in one batch (runs on the Tk main loop)"""
+        lines = []
+        try:
+            while len(lines) < LOG_BATCH_SIZE:
+                lines.append(self.log_queue.get_nowait())
+        except Empty:
+            pass
+        
+        if lines:
+            self.log_history.extend(lines)
+            if not self.log_paused.get():
+                visible = [line for line in lines if self._log_visible(line)]
+                if visible:
+                    self.log_area.insert(tk.END, ''.join(visible))
+                    self._trim_log_area()
+                    self.log_area.see(tk.END)
+        
+        # Come back sooner while there is a backlog
+        self.root.after(1 if len(lines) == LOG_BATCH_SIZE else LOG_FLUSH_MS, self._drain_logs)
+
+    def _log_visible(self, line):
+        text = self.log_filter.get().strip().lower()
+        return not text or text in line.lower()
+
+    def _trim_log_area(self):
+        """Keep at most LOG_MAX_LINES lines in the log area"""
+        line_count = int(self.log_area.index('end-1c').split('.')[0])
+        if line_count > LOG_MAX_LINES:
+            self.log_area.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
+
+    def _render_logs(self):
+        """Redraw the log area from history after the filter or pause state changed"""
+        if self.log_paused.get():
+            return
+        self.log_area.delete('1.0', tk.END)
+        self.log_area.insert(tk.END, ''.join(line for line in self.log_history if self._log_visible(line)))
+        self.log_area.see(tk.END)